@@ -48,11 +48,88 @@ private def mkGenerator (e : Expr) : MetaM (Level × Expr × Expr × Expr) := do
 
 
 
-elab "#samplenl " e:term : command =>
+/--
+Sample `count` values of a generator and return their `repr`s.
+Sample `i` is generated with size `i % (maxSize + 1)`, so sizes cycle from 0 up to `maxSize`.
+-/
+def sampleReprs {t : Type u} [Repr t] (g : Gen t) (count maxSize : Nat) : IO (Array String) := do
+  letI : MonadLift Id IO := ⟨fun f => pure <| Id.run f⟩
+  do
+    let xs : List Std.Format ← Plausible.runRand <| Rand.down <| do
+      let xs : List t ← (List.range count).mapM (fun i => ReaderT.run g (ULift.up (i % (maxSize + 1))))
+      pure <| ULift.up (xs.map repr)
+    return xs.toArray.map toString
+
+/--
+`#samplenl T` prints 10 samples of type `T` (or of a generator `Gen T`), separated by blank lines.
+
+Options, in this order, before the types:
+- `json`: print one JSON object per line, `{"sample": i, "values": [...]}`, with the `repr` of the
+  `i`-th sample of each type
+- `count n`: number of samples (default 10)
+- `size n`: maximum size parameter passed to the generators (default `count - 1`)
+
+Several types can be sampled at once, e.g. `#samplenl json count 20 size 9 Nat, (List Int)`.
+-/
+syntax (name := samplenl) "#samplenl " (&"json")? (&"count" num)? (&"size" num)? term,+ : command
+
+@[command_elab samplenl] def elabSamplenl : Command.CommandElab := fun stx =>
   Command.runTermElabM fun _ => do
-    let e ← Elab.Term.elabTermAndSynthesize e none
-    let ⟨u, α, repr, gen⟩ ← mkGenerator e
-    let printSamples := mkApp3 (mkConst ``printSamples2 [u]) α repr gen
-    let code ← unsafe evalExpr (IO PUnit) (mkApp (mkConst ``IO) (mkConst ``PUnit [1])) printSamples
-    _ ← code
+    let json := !stx[1].isNone
+    let count := stx[2][1].isNatLit?.getD 10
+    let maxSize := stx[3][1].isNatLit?.getD (count - 1)
+    let mut columns : Array (Array String) := #[]
+    for e in stx[4].getSepArgs do
+      let e ← Elab.Term.elabTermAndSynthesize e none
+      let ⟨u, α, repr, gen⟩ ← mkGenerator e
+      let sample := mkAppN (mkConst ``sampleReprs [u]) #[α, repr, gen, mkNatLit count, mkNatLit maxSize]
+      let code ← unsafe evalExpr (IO (Array String)) (mkApp (mkConst ``IO) (mkApp (mkConst ``Array [levelZero]) (mkConst ``String))) sample
+      columns := columns.push (← code)
+    for i in [0:count] do
+      let values := columns.map (·[i]!)
+      if json then
+        IO.println (Json.compress (Json.mkObj [("sample", toJson i), ("values", toJson values)]))
+      else
+        for v in values do
+          IO.println s!"{v}\n"
+
+/-- The `repr`s of the shrinks of `x`. -/
+def shrinkReprs {t : Type u} [Repr t] [Shrinkable t] (x : t) : Array String :=
+  (Shrinkable.shrink x).toArray.map (fun y => toString (repr y))
+
+/--
+`#shrinknl T, x` logs the shrinks of `x` as a JSON object `{"shrinks": [...]}` with their `repr`s.
+`x` is a value of the proxy type used to sample `T`, which is usually `T` itself.
+-/
+elab "#shrinknl " t:term ", " x:term : command =>
+  Command.runTermElabM fun _ => do
+    let t ← Elab.Term.elabType t
+    let u ← getLevel t
+    let v ← mkFreshLevelMVar
+    let inst ← synthInstance (mkApp (mkConst ``SampleableExt [u, v]) t)
+    let v ← instantiateLevelMVars v
+    let typ ← whnf (mkApp2 (mkConst ``SampleableExt.proxy [u, v]) t inst)
+    let x ← Elab.Term.elabTermEnsuringType x typ
+    Elab.Term.synthesizeSyntheticMVarsNoPostponing
+    let x ← instantiateMVars x
+    let reprInst := mkApp2 (mkConst ``SampleableExt.proxyRepr [u, v]) t inst
+    let shrinkInst := mkApp2 (mkConst ``SampleableExt.shrink [u, v]) t inst
+    let shrinks := mkAppN (mkConst ``shrinkReprs [v]) #[typ, reprInst, shrinkInst, x]
+    let reprs ← unsafe evalExpr (Array String) (mkApp (mkConst ``Array [levelZero]) (mkConst ``String)) shrinks
+    logInfo (Json.compress (Json.mkObj [("shrinks", toJson reprs)]))
+
+/--
+Sample a value of `α` with the given size, for the compiled test harness of pbtdp.
+Returns the value together with the `repr` of the sampled proxy value.
+-/
+def harnessSample (α : Type) [inst : SampleableExt.{1, 0} α] (size : Nat) : IO (α × String) := do
+  let x ← (SampleableExt.sample : Gen (SampleableExt.proxy α)).run size
+  return (SampleableExt.interp x, toString (inst.proxyRepr.reprPrec x 0))
+
+/-- How the compiled test harness of pbtdp prints the result of the tested function, like `#eval`. -/
+class HarnessOutput (α : Type u) where
+  run : α → IO Unit
 
+instance (priority := low) {α : Type u} [Repr α] : HarnessOutput α := ⟨fun a => IO.println (repr a)⟩
+instance : HarnessOutput Unit := ⟨fun _ => pure ()⟩
+instance {α : Type} [HarnessOutput α] : HarnessOutput (IO α) := ⟨fun a => do HarnessOutput.run (← a)⟩
@@ -0,0 +1,43 @@
+import Lean
+
+open Lean Elab Tactic Meta
+
+/--
+Tactic used by the SorryHammer plugin to try a hammer at every `sorry` of a file in one elaboration.
+
+`hole_hammer k | tac₀ | tac₁ | ...` tries the tactics in order on the main goal, like `first`.
+If `tacᵢ` closes the goal, it reports `hole_hammer k: closed by tactic i` followed by the proof term.
+Otherwise it reports `hole_hammer k: failed` and acts like `sorry` (admits the goal),
+so that the holes after it are still tried. Each tactic runs with a fresh `maxHeartbeats` budget,
+and one that runs out of heartbeats counts as failed.
+
+Usage:
+- `hole_hammer 0 | hammer`
+- `hole_hammer 3 | omega | simp_all | hammer`
+-/
+syntax (name := holeHammer) "hole_hammer " num withPosition((ppDedent(ppLine) colGe "| " tacticSeq)+) : tactic
+
+@[tactic holeHammer] def evalHoleHammer : Tactic := fun stx => do
+  let k := stx[1].isNatLit?.getD 0
+  let tacs := stx[2].getArgs.map (·[1])
+  let mainGoal ← getMainGoal
+  for i in [0:tacs.size] do
+    let saved ← saveState
+    -- each attempt gets its own heartbeat budget, and running out of it (a runtime exception,
+    -- which `try ... catch` does not catch) only fails this attempt, not the whole declaration
+    let closed ← tryCatchRuntimeEx
+      (withCurrHeartbeats do
+        let remaining ← Tactic.run mainGoal (Term.withoutErrToSorry (withoutRecover (evalTactic tacs[i]!)))
+        let proof ← instantiateMVars (mkMVar mainGoal)
+        return remaining.isEmpty && !proof.hasSorry)
+      (fun _ => return false)
+    if closed then
+      let proof ← instantiateMVars (mkMVar mainGoal)
+      replaceMainGoal []
+      logInfo m!"hole_hammer {k}: closed by tactic {i}{indentExpr proof}"
+      return
+    saved.restore
+  -- none of the tactics closed the goal: act like `sorry`
+  mainGoal.admit
+  replaceMainGoal []
+  logInfo m!"hole_hammer {k}: failed"
@@ -17,3 +17,8 @@ require "leanprover-community" / "mathlib" @ git "v4.20.1"
 @[default_target]
 lean_lib «LeanTool» where
   -- add any library configuration options here
+
+-- Test harness compiled by pbtdp (`--native`); the source is generated in `.lake/pbtdp`.
+lean_exe pbtdp_harness where
+  srcDir := ".lake/pbtdp"
+  root := `PbtdpHarness
@@ -0,0 +1,285 @@
+import asyncio
+import json
+import io
+import sys
+import traceback
+from datetime import datetime
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+import uvicorn
+
+from leantool import interactive_lean_check, models
+
+
+def get_api_key(request):
+    """Extract API key from request headers"""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        print("No Authorization header")
+        return None
+
+    # Handle 'Bearer <key>' format
+    parts = auth_header.split()
+    if len(parts) == 2 and parts[0].lower() == 'bearer':
+        return parts[1]
+    elif len(parts) == 1:
+        return parts[0]
+
+    raise ValueError("Invalid Authorization header format")
+
+def error_response(message, type, code, **extra):
+    return JSONResponse({
+        "error": {
+            "message": message,
+            "type": type,
+            "code": code,
+            **extra
+        }
+    }, status_code=code)
+
+# The verbose transcript of the attempts, in pieces that are sent as soon as they are
+# available when streaming; together they make up the text of the non-streaming response.
+
+def format_attempt_start(i, thought, code):
+    attf=io.StringIO()
+    print(f"\nAttempt {i}:",file=attf)
+    if thought is not None:
+        print("Thought:\n"+thought,file=attf)
+    print("Code:",file=attf)
+    print("```\n"+code+"\n```\n",file=attf)
+    return attf.getvalue()
+
+def format_attempt_result(result):
+    attf=io.StringIO()
+    print("Success:", result["success"], file=attf)
+    print("Output:", result["output"], file=attf)
+    if result["error"]:
+        print("Error:", result["error"], file=attf)
+    return attf.getvalue()
+
+def format_attempt_error(i, error):
+    return f"\nAttempt {i}:\nError: {error}\n"
+
+def format_attempts(attempts):
+    out = "\nAttempts:\n" if len(attempts)>0 else ""
+    for i, attempt in enumerate(attempts, 1):
+        if "code" in attempt:
+            out += format_attempt_start(i, attempt.get("thought"), attempt["code"])
+            if "result" in attempt:
+                out += format_attempt_result(attempt["result"])
+        elif "error" in attempt:
+            out += format_attempt_error(i, attempt["error"])
+    return out
+
+def final_message(result):
+    """The last assistant message of a lean tool result, or an error response."""
+    if not result.get("messages"):
+        return {
+            "error": {
+                "message": "No messages in result",
+                "type": "internal_error",
+                "code": 500
+            }
+        }
+
+    # Get the last assistant message
+    assistant_msgs = [m for m in result["messages"] if m["role"] == "assistant"]
+    if not assistant_msgs:
+        return {
+            "error": {
+                "message": "No assistant response in result",
+                "type": "internal_error",
+                "code": 500
+            }
+        }
+
+    if assistant_msgs[-1].get("tool_calls",None):
+        return {"role": 'assistant', 'content': ''}
+    return dict(assistant_msgs[-1])
+
+def create_chat_completion_response(result, model, verbose=True):
+    """Convert lean tool result into OpenAI-compatible response format"""
+    out_msg = final_message(result)
+    if "error" in out_msg:
+        return out_msg
+
+    if verbose:
+        out_msg['content']=format_attempts(result["attempts"])+(out_msg.get('content') or '')
+
+    print (out_msg)
+    usage = result.get("usage") or {}
+
+    response = {
+        "id": f"chatcmpl-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+        "object": "chat.completion",
+        "created": int(datetime.now().timestamp()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": out_msg,
+                "finish_reason": "stop"
+            }
+        ],
+        "usage": {
+            "prompt_tokens": usage.get("prompt_tokens", -1),
+            "completion_tokens": usage.get("completion_tokens", -1),
+            "total_tokens": usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0) if usage else -1,
+            "prompt_tokens_details": {"cached_tokens": usage.get("cached_tokens", 0)}
+        }
+    }
+
+    return response
+
+
+def sse_chunk(content, model, finish_reason=None):
+    return "data: " + json.dumps({
+            "object": "chat.completion.chunk",
+            "choices": [{"delta": {"content": content, "role": "assistant"}, "index": 0, "finish_reason": finish_reason}],
+            "model": model,
+    }) + "\n\n"
+
+async def generate_streaming_response(run_kwargs, model):
+    """
+    Run interactive_lean_check and send the transcript as SSE deltas while it runs:
+    each Lean attempt when it starts and when its result arrives, then the final answer.
+    LLM turns without a Lean check are sent as SSE comments, which keep the connection alive.
+    """
+    events = asyncio.Queue()
+    started = [False]
+
+    def on_event(event):
+        t = event["type"]
+        text = ""
+        if t in ("lean_check", "error") and not started[0]:
+            started[0] = True
+            text += "\nAttempts:\n"
+        if t == "lean_check":
+            text += format_attempt_start(event["attempt"]+1, event["thought"], event["code"])
+        elif t == "lean_result":
+            text += format_attempt_result(event["result"])
+        elif t == "error":
+            text += format_attempt_error(event["attempt"]+1, event["error"])
+        if text:
+            events.put_nowait(sse_chunk(text, model))
+        else:
+            events.put_nowait(f": {t}\n\n")
+
+    task = asyncio.create_task(interactive_lean_check(on_event=on_event, **run_kwargs))
+    task.add_done_callback(lambda _: events.put_nowait(None))
+    try:
+        while True:
+            chunk = await events.get()
+            if chunk is None:
+                break
+            yield chunk
+        try:
+            result = task.result()
+            out_msg = final_message(result)
+            final = out_msg["error"]["message"] if "error" in out_msg else (out_msg.get("content") or "")
+        except Exception as e:
+            print("Error:", str(e))
+            print("Traceback:", traceback.format_exc())
+            final = f"Error: {e}"
+        yield sse_chunk(final, model, finish_reason="stop")
+        # Yield the final message to indicate the stream has ended
+        yield "data: [DONE]\n\n"
+    finally:
+        # the client disconnected: stop working on its request
+        task.cancel()
+
+async def chat_completions(request: Request):
+    try:
+        # Get API key first
+        try:
+            api_key = get_api_key(request)
+        except ValueError as e:
+            return error_response(str(e), "authentication_error", 401)
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+
+        if not data:
+            return error_response("No JSON data provided", "invalid_request_error", 400)
+
+        # Extract required fields
+        messages = data.get("messages", [])
+        if not messages:
+            return error_response("No messages provided", "invalid_request_error", 400)
+
+        # Get model from request or use default
+        model = data.get("model", "sonnet")
+        if model not in models:
+            model = "sonnet"  # Default to sonnet if unknown model
+
+        # Extract other parameters
+        temperature = data.get("temperature", 0.1)
+        max_attempts = data.get("max_attempts", 5)
+        run_kwargs = dict(
+            proof_request=messages[-1]["content"],
+            model=models[model],
+            temperature=temperature,
+            max_attempts=max_attempts,
+            messages=messages[:-1],  # Pass previous messages for context
+            api_key=api_key
+        )
+        if data.get("full_output", False):
+            run_kwargs["diagnostics"] = None
+
+        if data.get("stream", False):
+            return StreamingResponse(generate_streaming_response(run_kwargs, model), media_type='text/event-stream')
+
+        result = await interactive_lean_check(**run_kwargs)
+        # Convert result to OpenAI format
+        response = create_chat_completion_response(result, data.get("model", "default"))
+
+        if "error" in response:
+            return JSONResponse(response, status_code=500)
+        return JSONResponse(response)
+
+    except Exception as e:
+        print("Error:", str(e))
+        print("Traceback:", traceback.format_exc())
+        return error_response(str(e), "internal_error", 500, traceback=traceback.format_exc())
+
+def model_info(model_id):
+    return {
+        "id": model_id,
+        "object": "model",
+        "created": 1677610602,  # placeholder timestamp
+        "owned_by": "local",
+        "permission": [],
+        "root": models[model_id],
+        "parent": None,
+        "context_window": 100000,  # placeholder value
+        "messages_supported": True,
+        "tools_supported": True,
+    }
+
+async def list_models(request: Request):
+    """OpenAI-compatible endpoint to list available models"""
+    return JSONResponse({
+        "object": "list",
+        "data": [model_info(model_id) for model_id in models]
+    })
+
+async def get_model(request: Request):
+    """Get information about a specific model"""
+    model_id = request.path_params["model_id"]
+    if model_id not in models:
+        return error_response(f"Model '{model_id}' not found", "invalid_request_error", 404)
+    return JSONResponse(model_info(model_id))
+
+app = Starlette(routes=[
+    Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+    Route("/v1/models", list_models, methods=["GET"]),
+    Route("/v1/models/{model_id:path}", get_model, methods=["GET"]),
+])
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv)>1 else 8000
+    uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import os
+import time
+import traceback
+from typing import Dict, Any, List
+
+import leancache
+import leanrunner
+import ratelimit
+from leantool import interactive_lean_check, models
+
+# Options of interactive_lean_check that a problem can set for itself
+PROBLEM_OPTIONS = ['prefix', 'max_attempts', 'temperature', 'final_check', 'plain_text_mode']
+
+
+def read_problems(path: str, id_field: str = 'id') -> List[Dict[str, Any]]:
+    """Read problems from a JSONL file. Problems without `id_field` are identified by their line number."""
+    problems = []
+    with open(path, encoding='utf-8') as f:
+        for i, ln in enumerate(f):
+            if not ln.strip():
+                continue
+            p = json.loads(ln)
+            p.setdefault(id_field, i)
+            problems.append(p)
+    return problems
+
+
+def read_checkpoint(path: str, id_field: str = 'id', retry_errors: bool = False) -> set:
+    """
+    Ids of the problems already finished in an output file. A line cut short by a crash is removed,
+    so that new results can be appended. With `retry_errors`, problems that raised an exception are run again.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+            data = data[:data.rfind(b'\n') + 1]
+    for ln in data.decode('utf-8').splitlines():
+        r = json.loads(ln)
+        if retry_errors and 'exception' in r:
+            done.discard(r[id_field])
+        else:
+            done.add(r[id_field])
+    return done
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+async def run_batch(problems_path: str, output_path: str, concurrency: int = 4, prompt_field: str = 'proof_request',
+                    id_field: str = 'id', retry_errors: bool = False, save_messages: bool = False, **kwargs) -> Dict[str, int]:
+    """
+    Run interactive_lean_check on every problem of a JSONL file, with at most `concurrency` problems
+    (and therefore LLM calls) in flight; Lean runs are limited by leanrunner's process-wide limit.
+    Each result is appended to `output_path` as soon as it finishes, and problems already in the output
+    are skipped, so an interrupted run can be resumed by running the same command again.
+    `kwargs` are passed on to interactive_lean_check; a problem can override those in PROBLEM_OPTIONS.
+    Returns the numbers of problems run, succeeded and raised.
+    """
+    problems = read_problems(problems_path, id_field)
+    done = read_checkpoint(output_path, id_field, retry_errors)
+    todo = [p for p in problems if p[id_field] not in done]
+    print(f"{len(problems)} problems, {len(problems) - len(todo)} already done, {len(todo)} to run")
+
+    sem = asyncio.Semaphore(concurrency)
+    stats = {'run': 0, 'success': 0, 'exception': 0}
+    t0 = time.monotonic()
+
+    async def run_one(problem, out):
+        async with sem:
+            t1 = time.monotonic()
+            options = dict(kwargs)
+            options.update({k: problem[k] for k in PROBLEM_OPTIONS if k in problem})
+            record = {id_field: problem[id_field]}
+            try:
+                result = await interactive_lean_check(problem[prompt_field], **options)
+                record.update({k: v for k, v in result.items() if save_messages or k != 'messages'})
+            except Exception as e:
+                record.update({'success': False, 'exception': f"{e}\n{traceback.format_exc()}"})
+            record['elapsed'] = time.monotonic() - t1
+        out.write(json.dumps(record, default=str) + '\n')
+        out.flush()
+        os.fsync(out.fileno())
+        stats['run'] += 1
+        stats['success'] += bool(record.get('success'))
+        stats['exception'] += 'exception' in record
+        elapsed = time.monotonic() - t0
+        rate = stats['run'] / elapsed
+        eta = (len(todo) - stats['run']) / rate
+        print(f"[{stats['run']}/{len(todo)}] {problem[id_field]}: success={record.get('success')} "
+              f"({record['elapsed']:.0f}s); {rate * 60:.1f} problems/min, "
+              f"{stats['success']} succeeded, ETA {format_duration(eta)}")
+
+    with open(output_path, 'a', encoding='utf-8') as out:
+        await asyncio.gather(*[run_one(p, out) for p in todo])
+    print(f"Finished {stats['run']} problems in {format_duration(time.monotonic() - t0)}: "
+          f"{stats['success']} succeeded, {stats['exception']} raised")
+    return stats
+
+
+async def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Run LeanTool on a JSONL file of problems, resuming from the output file if it exists')
+    parser.add_argument('problems', help='JSONL file with one problem per line')
+    parser.add_argument('output', help='JSONL file the results are appended to')
+    parser.add_argument('--prompt-field', default='proof_request', help='field of each problem holding the request to the LLM (default: proof_request)')
+    parser.add_argument('--id-field', default='id', help='field identifying each problem (default: id; the line number if missing)')
+    parser.add_argument('--model', default='sonnet', help='model name, as in leantool.models, or a litellm model id')
+    parser.add_argument('--max-attempts', type=int, default=5)
+    parser.add_argument('--candidates', type=int, default=1, help='number of responses sampled per turn; their Lean checks run in parallel and the best one is kept')
+    parser.add_argument('--temperature', type=float, default=None, help='sampling temperature (default: 0.1; use a higher one with --candidates)')
+    parser.add_argument('--concurrency', type=int, default=4, help='number of problems worked on at the same time')
+    parser.add_argument('--max-lean-processes', type=int, default=None, help='maximum number of Lean processes running at the same time (default: based on cores and RAM)')
+    parser.add_argument('--rpm', type=float, default=None, help="limit on LLM requests per minute to the model's provider")
+    parser.add_argument('--tpm', type=float, default=None, help="limit on LLM tokens per minute to the model's provider")
+    parser.add_argument('--llm-cache', metavar='PATH', default=None, help='SQLite file caching the LLM responses')
+    parser.add_argument('--replay', action='store_true', help='only use LLM responses from --llm-cache; a problem fails on a cache miss')
+    parser.add_argument('--retry-errors', action='store_true', help='run again the problems that raised an exception')
+    parser.add_argument('--save-messages', action='store_true', help='include the message history in the results')
+    args = parser.parse_args()
+    leanrunner.configure(args.max_lean_processes)
+    if args.llm_cache:
+        leancache.set_default_llm_cache(leancache.LLMCache(args.llm_cache, replay=args.replay))
+    elif args.replay:
+        parser.error('--replay requires --llm-cache')
+    model = models.get(args.model, args.model)
+    ratelimit.configure({ratelimit.provider_of(model): {'requests_per_minute': args.rpm, 'tokens_per_minute': args.tpm}})
+    await run_batch(args.problems, args.output, concurrency=args.concurrency, prompt_field=args.prompt_field,
+                    id_field=args.id_field, retry_errors=args.retry_errors, save_messages=args.save_messages,
+                    model=model, max_attempts=args.max_attempts, candidates=args.candidates,
+                    **({'temperature': args.temperature} if args.temperature is not None else {}))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Any, Optional
+
+
+def plugin_fingerprint(p) -> str:
+    """
+    Identify a plugin and its configuration. Plugins can set `cache_key` to
+    control this; otherwise the class name and simple attributes are used.
+    """
+    if hasattr(p, 'cache_key'):
+        return str(p.cache_key)
+    attrs = {k: v for k, v in vars(p).items() if isinstance(v, (str, int, float, bool, tuple, list))}
+    return type(p).__qualname__ + json.dumps(attrs, sort_keys=True, default=str)
+
+
+def read_project_file(project_path: str, name: str) -> str:
+    try:
+        with open(os.path.join(project_path, name), encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return ''
+
+
+class LeanCache:
+    """
+    Persistent cache of check_lean_code results, keyed by a hash of the code,
+    the options, plugins and maxHeartbeats limit, and the project's `lean-toolchain` and
+    `lake-manifest.json`, so that upgrading Lean or dependencies invalidates it.
+    Stored in SQLite so that several processes can share it; least recently
+    used entries are evicted once the total size exceeds `max_bytes`.
+    """
+    default_file = 'lean_results.sqlite'
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = 512 * 1024**2, project_path: str = '.'):
+        if path is None:
+            path = os.path.join(os.path.expanduser('~/.cache/leantool'), self.default_file)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.project_path = project_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, size INTEGER, last_access REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results(last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, count INTEGER)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def key(self, code: str, json_output: bool, sorry_hammer: bool, plugins, heartbeats: Optional[int] = None) -> str:
+        parts = [
+            code,
+            json_output,
+            sorry_hammer,
+            [plugin_fingerprint(p) for p in plugins],
+            read_project_file(self.project_path, 'lean-toolchain'),
+            read_project_file(self.project_path, 'lake-manifest.json'),
+        ]
+        if heartbeats:
+            # the result of a check can depend on its maxHeartbeats limit
+            parts.append({'heartbeats': heartbeats})
+        return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM results WHERE key=?", (key,)).fetchone()
+            stat = 'hits' if row else 'misses'
+            conn.execute("INSERT INTO stats VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET count=count+1", (stat,))
+            if row:
+                conn.execute("UPDATE results SET last_access=? WHERE key=?", (time.time(), key))
+                return row[0]
+        return None
+
+    def _put(self, key: str, value: str):
+        size = len(value.encode('utf-8'))
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, value, size, time.time()))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > self.max_bytes:
+                evict = []
+                for k, sz in conn.execute("SELECT key, size FROM results ORDER BY last_access"):
+                    if total <= self.max_bytes:
+                        break
+                    evict.append((k,))
+                    total -= sz
+                conn.executemany("DELETE FROM results WHERE key=?", evict)
+            conn.execute("COMMIT")
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = await asyncio.to_thread(self._get, key)
+        return json.loads(value) if value is not None else None
+
+    async def put(self, key: str, result: Dict[str, Any]):
+        await asyncio.to_thread(self._put, key, json.dumps(result, default=str))
+
+    def stats(self) -> Dict[str, int]:
+        """Hits and misses of all processes sharing the cache, and its current size."""
+        with self._connect() as conn:
+            stats = {'hits': 0, 'misses': 0}
+            stats.update(dict(conn.execute("SELECT name, count FROM stats").fetchall()))
+            stats['entries'], stats['bytes'] = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return stats
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results")
+            conn.execute("DELETE FROM stats")
+
+
+class CacheMiss(Exception):
+    """Raised by an LLMCache in replay mode when a request is not in the cache."""
+
+
+class LLMCache(LeanCache):
+    """
+    Persistent cache of LLM responses, keyed by the model, the messages sent, and the other
+    request parameters (tools, temperature, ...), stored like LeanCache.
+    In `replay` mode, a request that is not in the cache raises CacheMiss instead of calling the
+    LLM, so that a re-run is guaranteed to reproduce the recorded conversations without network access.
+    """
+    default_file = 'llm_responses.sqlite'
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = 1024**3, replay: bool = False):
+        super().__init__(path, max_bytes)
+        self.replay = replay
+
+    def key(self, model: str, messages, params: Dict[str, Any]) -> str:
+        parts = [model, messages, {k: v for k, v in params.items() if k != 'api_key'}]
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        response = await super().get(key)
+        if response is None and self.replay:
+            raise CacheMiss(f"LLM request {key} is not in the cache {self.path}")
+        return response
+
+
+# Cache used by `leantool.check_lean_code` when no cache is passed explicitly.
+# Enabled for every process that sets the environment variable LEANTOOL_CACHE_DIR.
+default_cache: Optional[LeanCache] = None
+if os.environ.get('LEANTOOL_CACHE_DIR'):
+    default_cache = LeanCache(os.path.join(os.environ['LEANTOOL_CACHE_DIR'], 'lean_results.sqlite'))
+
+
+def set_default_cache(cache: Optional[LeanCache]):
+    global default_cache
+    default_cache = cache
+
+
+# Cache used by `leantool.interactive_lean_check` when no LLM cache is passed explicitly.
+# Enabled by the environment variable LEANTOOL_LLM_CACHE_DIR; LEANTOOL_LLM_REPLAY=1 turns on replay mode.
+default_llm_cache: Optional[LLMCache] = None
+if os.environ.get('LEANTOOL_LLM_CACHE_DIR'):
+    default_llm_cache = LLMCache(os.path.join(os.environ['LEANTOOL_LLM_CACHE_DIR'], LLMCache.default_file),
+                                 replay=os.environ.get('LEANTOOL_LLM_REPLAY') == '1')
+
+
+def set_default_llm_cache(cache: Optional[LLMCache]):
+    global default_llm_cache
+    default_llm_cache = cache
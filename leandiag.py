@@ -0,0 +1,229 @@
+import re
+from typing import Dict, List, Optional, Any, Tuple, Union
+
+# A message of Lean's text output, or a message string from Pantograph
+MESSAGE_RE = re.compile(
+    r"^(?P<file>.*?):(?P<line>\d+):(?P<col>\d+)(?:-(?P<eline>\d+):(?P<ecol>\d+))?: (?P<severity>error|warning|info):?\s?(?P<data>.*)$",
+    re.DOTALL
+)
+# The first line of each message in Lean's text output
+MESSAGE_START_RE = re.compile(r"^\S.*?:(?P<line>\d+):(?P<col>\d+)(?:-\d+:\d+)?: (?P<severity>error|warning|info)", re.MULTILINE)
+DECL_RE = re.compile(
+    r"^(?:@\[[^\]]*\]\s*)?(?:(?:private|protected|noncomputable|partial|unsafe|nonrec)\s+)*"
+    r"(?P<kind>theorem|lemma|def|example|instance|abbrev|structure|inductive|class|opaque|axiom)\b[ \t]*(?P<name>[^\s:({\[]*)",
+    re.MULTILINE
+)
+
+# Start of the sections that plugins add to the text output: LoadSorry's goal states and SorryHammer's reports
+PLUGIN_SECTION_RE = re.compile(r"^(?:Goal States from sorrys:|SorryHammer )", re.MULTILINE)
+
+# Ranks of the messages kept first when the output is over its size limit; other text (e.g. added by a plugin) counts as info
+SEVERITY_RANK = {'error': 0, 'information': 1, 'warning': 2}
+# The warning that marks code with sorry; it is never left out, so that the compacted output still shows the sorry
+SORRY_WARNING = "declaration uses 'sorry'"
+
+
+def split_messages(output: str) -> List[str]:
+    """
+    Split Lean's text output into its messages. Text before the first message, and each section added
+    by a plugin (see PLUGIN_SECTION_RE), is kept as its own item.
+    """
+    starts = {m.start() for m in MESSAGE_START_RE.finditer(output)}
+    starts = sorted(starts | {m.start() for m in PLUGIN_SECTION_RE.finditer(output)})
+    if not starts or starts[0] > 0:
+        starts = [0] + starts
+    return [output[s:e] for s, e in zip(starts, starts[1:] + [len(output)]) if output[s:e]]
+
+
+def parse_message(msg: str) -> Dict[str, Any]:
+    """Convert a message string from Lean's text output or from Pantograph into the format of `lean --json`"""
+    m = MESSAGE_RE.match(msg.strip())
+    if not m:
+        return {'severity': None, 'pos': None, 'endPos': None, 'data': msg.strip()}
+    end_pos = None
+    if m.group('eline'):
+        end_pos = {'line': int(m.group('eline')), 'column': int(m.group('ecol'))}
+    return {
+        'severity': 'information' if m.group('severity') == 'info' else m.group('severity'),
+        'fileName': m.group('file'),
+        'pos': {'line': int(m.group('line')), 'column': int(m.group('col'))},
+        'endPos': end_pos,
+        'data': m.group('data'),
+    }
+
+
+def is_error(msg: str) -> bool:
+    m = MESSAGE_RE.match(msg.strip())
+    return m is not None and m.group('severity') == 'error'
+
+
+def declarations(code: str) -> List[Tuple[int, str]]:
+    """The (line, name) of each top-level declaration of the code, in order; examples are named `example`."""
+    return [(code.count('\n', 0, m.start()) + 1, m.group('name') or m.group('kind')) for m in DECL_RE.finditer(code)]
+
+
+def declaration_at(decls: List[Tuple[int, str]], line: int) -> Optional[str]:
+    name = None
+    for start, n in decls:
+        if start > line:
+            break
+        name = n
+    return name
+
+
+def parse_output(output: Union[str, List[Dict[str, Any]]], code: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    The messages of a check_lean_code output, text or JSON, as dicts in the format of `lean --json`,
+    with the name of the declaration each message is in (`decl`) if the code is given.
+    Text that is not a Lean message, e.g. added by a plugin, has severity None.
+    """
+    if isinstance(output, str):
+        messages = [dict(parse_message(text), text=text) for text in split_messages(output)]
+    else:
+        messages = [dict(m) for m in output]
+    if code is not None:
+        decls = declarations(code)
+        for m in messages:
+            if m.get('pos'):
+                m['decl'] = declaration_at(decls, m['pos']['line'])
+    return messages
+
+
+def truncate(text: str, max_chars: int) -> str:
+    """Shorten text to about max_chars, keeping its beginning and its end."""
+    if len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    return text[:head] + f"\n... ({len(text) - head - tail} characters omitted) ...\n" + text[len(text) - tail:]
+
+
+def truncate_goals(text: str, max_chars: int) -> str:
+    """Shorten goal states, separated by blank lines, to about max_chars by keeping whole goals from the start."""
+    if len(text) <= max_chars:
+        return text
+    goals = text.split('\n\n')
+    kept = [truncate(goals[0], max_chars)]
+    size = len(kept[0])
+    for goal in goals[1:]:
+        if size + len(goal) + 2 > max_chars:
+            break
+        kept.append(goal)
+        size += len(goal) + 2
+    return '\n\n'.join(kept) + f"\n\n({len(goals) - len(kept)} more goal states omitted)\n"
+
+
+class DiagnosticsPolicy:
+    """
+    How Lean's output is shortened before it is shown to an LLM or returned by a tool.
+    Messages repeated with the same severity and text are reported once, with the lines of the repeats.
+    Each message is cut to `max_message_chars`, keeping its beginning and end, and messages are then
+    kept up to `max_total_chars` in all: errors first, in the order of the code, then infos and other
+    text, then warnings. The messages kept stay in their original order. Sections added by plugins,
+    such as the goal states from LoadSorry, are cut between goals rather than in the middle of one,
+    and the "declaration uses 'sorry'" warnings are always kept.
+    """
+    def __init__(self, max_message_chars: int = 2000, max_total_chars: int = 8000, dedupe: bool = True):
+        self.max_message_chars = max_message_chars
+        self.max_total_chars = max_total_chars
+        self.dedupe = dedupe
+
+
+def compact_output(output: Union[str, List[Dict[str, Any]]], code: Optional[str] = None,
+                   policy: Optional[DiagnosticsPolicy] = None) -> Tuple[Union[str, List[Dict[str, Any]]], Dict[str, int]]:
+    """
+    Shorten a check_lean_code output according to the policy. The output keeps its format: text stays text,
+    and JSON messages stay JSON messages, with their `decl` added if the code is given.
+    Returns the output and the number of messages, and of those merged as duplicates, cut, and omitted.
+    """
+    policy = policy or DiagnosticsPolicy()
+    text_output = isinstance(output, str)
+    messages = parse_output(output, code)
+    stats = {'messages': len(messages), 'duplicates': 0, 'truncated': 0, 'omitted': 0}
+
+    kept = []
+    seen = {}
+    for m in messages:
+        key = (m.get('severity'), (m.get('data') or '').strip())
+        if policy.dedupe and m.get('severity') and key in seen:
+            first = seen[key]
+            first.setdefault('repeats', []).append(m['pos']['line'] if m.get('pos') else None)
+            stats['duplicates'] += 1
+            continue
+        seen[key] = m
+        kept.append(m)
+
+    def render(m):
+        if text_output:
+            text = m['text']
+            if m.get('repeats'):
+                text = text.rstrip('\n') + f"\n(the same message was also reported at lines {', '.join(str(ln) for ln in m['repeats'])})\n"
+        else:
+            text = m.get('goals') or m.get('data') or ''
+        if m.get('goals') or (text_output and PLUGIN_SECTION_RE.match(text.lstrip('\n'))):
+            short = truncate_goals(text, policy.max_message_chars)
+        else:
+            short = truncate(text, policy.max_message_chars)
+        if short != text:
+            stats['truncated'] += 1
+        if text_output:
+            return short
+        item = {k: v for k, v in m.items() if k != 'text'}
+        item['goals' if m.get('goals') else 'data'] = short
+        return item
+
+    def size(item):
+        return len(item) if text_output else len(str(item.get('data') or '')) + len(str(item.get('goals') or ''))
+
+    def required(m):
+        return m.get('severity') == 'warning' and SORRY_WARNING in (m.get('data') or '')
+
+    order = sorted(range(len(kept)), key=lambda i: (not required(kept[i]), SEVERITY_RANK.get(kept[i].get('severity'), 1), i))
+    selected = {}
+    total = 0
+    for i in order:
+        item = render(kept[i])
+        if not required(kept[i]) and selected and total + size(item) > policy.max_total_chars:
+            continue
+        selected[i] = item
+        total += size(item)
+    omitted = [kept[i] for i in range(len(kept)) if i not in selected]
+    stats['omitted'] = len(omitted)
+
+    result = [selected[i] for i in sorted(selected)]
+    if omitted:
+        counts = {}
+        for m in omitted:
+            sev = m.get('severity') or 'other'
+            counts[sev] = counts.get(sev, 0) + 1
+        note = (f"({len(omitted)} more messages omitted to keep the output short: "
+                + ', '.join(f"{n} {sev}" for sev, n in counts.items()) + ")")
+        result.append(note + '\n' if text_output else {'data': note})
+    if text_output:
+        return ''.join(r if r.endswith('\n') else r + '\n' for r in result), stats
+    return result, stats
+
+
+def compact_result(result: Dict[str, Any], code: Optional[str] = None, policy: Optional[DiagnosticsPolicy] = None) -> Dict[str, Any]:
+    """
+    A copy of a check_lean_code result with its output and error shortened by `compact_output`.
+    If anything was left out, `diagnostics` has the numbers from `compact_output`.
+    """
+    policy = policy or DiagnosticsPolicy()
+    output = result.get('output')
+    if not output or not isinstance(output, (str, list)):
+        return result
+    compacted, stats = compact_output(output, code, policy)
+    new_result = dict(result, output=compacted)
+    if isinstance(result.get('error'), str):
+        new_result['error'] = truncate(result['error'], policy.max_message_chars)
+    if stats['duplicates'] or stats['truncated'] or stats['omitted'] or new_result.get('error') != result.get('error'):
+        new_result['diagnostics'] = stats
+    return new_result
+
+
+def errors_only(output: Union[str, List[Dict[str, Any]]]) -> Union[str, List[Dict[str, Any]]]:
+    """The error messages of a check_lean_code output, in the same format."""
+    if isinstance(output, str):
+        return ''.join(m for m in split_messages(output) if is_error(m))
+    return [m for m in output if m.get('severity') == 'error']
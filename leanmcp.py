@@ -1,6 +1,6 @@
 from mcp.server.fastmcp import FastMCP
 import asyncio
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 from starlette.applications import Starlette
 from mcp.server.sse import SseServerTransport
@@ -9,15 +9,20 @@ from starlette.routing import Mount, Route
 from mcp.server import Server
 import uvicorn
 
-from leantool import check_lean_code
-from pbtdp import run_property_testing
+from leantool import check_lean_code, default_plugins, LoadSorry
+import leantool
+import leancache
+import leandiag
+import leanpool
+import leanrunner
+from pbtdp import run_property_testing, DEFAULT_WORKERS
 
 # Create an MCP server
 mcp = FastMCP("LeanTool")
 
 
 @mcp.tool()
-async def check_lean (code: str, json_output: bool = False, sorry_hammer: bool = False)-> Dict[str, Any]:
+async def check_lean (code: str, json_output: bool = False, sorry_hammer: bool = False, warm: bool = True, full_output: bool = False)-> Dict[str, Any]:
     """
     Sends code to the Lean executable and returns the results.
     If the code is syntactically correct but contains `sorry`s, 
@@ -27,6 +32,9 @@ async def check_lean (code: str, json_output: bool = False, sorry_hammer: bool =
         code: Lean code to check
         json_output: Whether to get output in JSON format
         sorry_hammer: If True, the tool will attempt to replace the first `sorry` in the code with a proof using a hammer tactic.
+        warm: If True, check the code on a warm Lean worker when the server keeps its imports loaded.
+        full_output: If True, return Lean's complete output. By default, repeated messages are reported once
+          and long output is shortened, keeping the errors first.
         
     Returns:
         Dictionary containing:
@@ -34,11 +42,33 @@ async def check_lean (code: str, json_output: bool = False, sorry_hammer: bool =
             - output: string or parsed JSON containing Lean's output
             - error: string containing error message if any
             - code: the modified code (if using sorry_hammer and the hammer was successful)
+            - diagnostics: if the output was shortened, the numbers of messages, and of those merged as duplicates, cut and omitted
     """
-    return await check_lean_code (code, json_output, sorry_hammer)
+    result = await check_lean_code (code, json_output, sorry_hammer, pool=None if warm else False)
+    return result if full_output else leandiag.compact_result(result, code)
 
 @mcp.tool()
-async def run_tests (code: str, signature: str, num_tests: int=20) -> Dict[str,Any]:
+async def check_lean_batch (codes: List[str], json_output: bool = False, sorry_hammer: bool = False, warm: bool = True, full_output: bool = False)-> List[Dict[str, Any]]:
+    """
+    Checks several independent Lean snippets at once, e.g. alternative proofs or separate lemmas.
+    The snippets are checked in parallel, and snippets with the same imports share warm Lean
+    processes that load the imports once, so this is much faster than calling check_lean once per snippet.
+
+    Args:
+        codes: list of Lean code snippets to check, each a complete file
+        json_output: Whether to get output in JSON format
+        sorry_hammer: If True, the tool will attempt to replace the first `sorry` in each snippet with a proof using a hammer tactic.
+        warm: If True, use warm Lean workers for snippets sharing imports.
+        full_output: If True, return Lean's complete output for each snippet instead of a shortened one.
+
+    Returns:
+        List with one dictionary per snippet, in the same order, as returned by check_lean.
+    """
+    results = await leantool.check_lean_batch(codes, json_output, sorry_hammer, pool=None if warm else False)
+    return results if full_output else [leandiag.compact_result(r, code) for r, code in zip(results, codes)]
+
+@mcp.tool()
+async def run_tests (code: str, signature: str, num_tests: int=20, workers: int=DEFAULT_WORKERS, native: bool=False, shrink_time: float=30) -> Dict[str,Any]:
     """
     Given Lean code containing a function with the given signature, evaluate the function with
     num_tests randomly-generated inputs. Collect the cases with 'Error:' or 'failed check:' in their output
@@ -47,16 +77,24 @@ async def run_tests (code: str, signature: str, num_tests: int=20) -> Dict[str,A
         code: Lean code containing definitions
         signature: signature of the function to test
         num_tests: number of tests to run
+        workers: number of Lean processes evaluating the tests in parallel
+        native: compile the code into an executable test harness instead of interpreting it with #eval!.
+          Much faster for algorithmic code; the first run of a given code pays for the compilation.
+        shrink_time: seconds to spend looking for smaller failing inputs (0 to disable)
     Returns:
         Dictionary containing:
             - total_tests: total number of tests run
             - passed: number of tests that passed without errors
             - unknown: number of tests that were not able to finish, due to run-time exceptions
             - failed: number of tests that contains 'Error:' or 'failed check:' in its output
-            - failures: list of input-output pairs that failed.
+            - failures: list of input-output pairs that failed, with the time taken by each.
+              If shrinking found smaller failing inputs, they are in shrunk_inputs, with their output in shrunk_output.
+            - case_times: time in seconds taken by each test case, in input order (None if it did not finish)
+            - sampling_time, elapsed: wall-clock seconds spent generating inputs, and in total
+            - native: whether the compiled harness was used (False if the code could not be compiled)
     """
     inputo={'function_signature':signature, 'code_solution':code}
-    return await run_property_testing(inputo, num_tests=num_tests )
+    return await run_property_testing(inputo, num_tests=num_tests, workers=workers, native=native, shrink_time=shrink_time)
 
 def create_starlette_app(mcp_server: Server, *, debug: bool = False) -> Starlette:
     """Create a Starlette application that can server the provied mcp server with SSE."""
@@ -76,6 +114,7 @@ def create_starlette_app(mcp_server: Server, *, debug: bool = False) -> Starlett
 
     return Starlette(
         debug=debug,
+        on_startup=[leanpool.default_pool.start],
         routes=[
             Route("/sse", endpoint=handle_sse),
             Mount("/messages/", app=sse.handle_post_message),
@@ -91,7 +130,29 @@ if __name__ == '__main__':
     parser.add_argument('--sse', action='store_true', help='serve via SSE')
     parser.add_argument('--host', default='0.0.0.0', help='Host to bind to')
     parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    parser.add_argument('--warm', action='append', metavar='IMPORTS',
+                        help='keep warm Lean workers with these (space-separated) imports loaded; can be repeated. E.g. --warm Mathlib --warm "Hammer Plausible"')
+    parser.add_argument('--warm-workers', type=int, default=1, help='number of warm Lean workers per import header')
+    parser.add_argument('--max-import-sets', type=int, default=4, help='number of other import sets for which Pantograph servers are kept for goal extraction')
+    parser.add_argument('--single-pass', action='store_true', help='for code with sorrys, get Lean messages and goal states from a single Pantograph elaboration')
+    parser.add_argument('--max-concurrency', type=int, default=None, help='maximum number of Lean processes running at the same time (default: based on cores and RAM)')
+    parser.add_argument('--timeout', type=float, default=None, help='wall-clock limit in seconds for each Lean process')
+    parser.add_argument('--cpu-time', type=float, default=None, help='CPU time limit in seconds for each Lean process')
+    parser.add_argument('--memory', type=float, default=None, help='memory limit in GB for each Lean process (not counting the mapped .olean files of the imports)')
+    parser.add_argument('--max-heartbeats', type=int, default=None, help="Lean's maxHeartbeats option for each check (in thousands, as in set_option)")
+    parser.add_argument('--cache', metavar='PATH', default=None, help='SQLite file for caching check results; can be shared with other LeanTool processes')
+    parser.add_argument('--cache-size', type=int, default=512, help='maximum cache size in MB')
     args = parser.parse_args()
+    if args.cache:
+        leancache.set_default_cache(leancache.LeanCache(args.cache, max_bytes=args.cache_size * 1024**2))
+    limits = None
+    if args.cpu_time or args.memory or args.max_heartbeats:
+        limits = leanrunner.ResourceLimits(args.cpu_time, int(args.memory * 1024**3) if args.memory else None, args.max_heartbeats)
+    leanrunner.configure(args.max_concurrency, args.timeout, limits)
+    for p in default_plugins:
+        if isinstance(p, LoadSorry):
+            p.single_pass = args.single_pass
+    leanpool.set_default_pool(leanpool.WarmPool([h.split() for h in args.warm or []], workers_per_header=args.warm_workers, max_import_sets=args.max_import_sets))
     if args.sse:
         mcp_server = mcp._mcp_server  # noqa: WPS437
 
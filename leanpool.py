@@ -0,0 +1,394 @@
+import asyncio
+import contextlib
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any
+
+import leandiag
+import leanrunner
+
+# Import headers that are kept loaded by default. Each header is a list of imports;
+# a submission is served by a warm worker only if its imports match a header exactly.
+DEFAULT_HEADERS = [
+    ['Mathlib'],
+    ['Hammer'],
+    ['Plausible'],
+    ['LeanTool.Basic'],
+]
+
+# Time limit in seconds of a check on a warm worker, if neither the pool nor leanrunner has one configured
+DEFAULT_TIMEOUT = 300
+
+def split_header(code: str):
+    """
+    Split Lean code into its list of imports and the body.
+    Import lines are replaced by empty lines in the body, so that positions in
+    Lean's messages still refer to the submitted code.
+    """
+    imports = []
+    body = ''
+    for ln in code.splitlines(keepends=True):
+        if ln.startswith('import'):
+            imports += ln.split()[1:]
+            body += '\n'
+        else:
+            body += ln
+    return imports, body
+
+
+def header_key(imports) -> frozenset:
+    return frozenset(['Init'] + list(imports))
+
+
+def message_to_json(msg: str) -> Dict[str, Any]:
+    """Convert a message string from Pantograph into the format of `lean --json`"""
+    m = leandiag.parse_message(msg)
+    if m['severity'] is None:
+        m['severity'] = 'information'
+    return m
+
+
+def process_tree_rss(pid: int) -> int:
+    """Resident memory in bytes of a process and its descendants (Linux only; 0 elsewhere)."""
+    total = 0
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for ln in f:
+                if ln.startswith('VmRSS:'):
+                    total += int(ln.split()[1]) * 1024
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            children = [int(c) for c in f.read().split()]
+    except (OSError, ValueError):
+        return total
+    return total + sum(process_tree_rss(c) for c in children)
+
+
+class LeanWorker:
+    """A Pantograph server process with a fixed set of imports loaded."""
+    def __init__(self, imports: List[str], project_path: str = '.'):
+        self.imports = imports
+        self.project_path = project_path
+        self.server = None
+        self.uses = 0
+        self.last_used = 0.0
+
+    async def start(self):
+        from pantograph import Server
+        print(f"Starting warm Lean worker. Imports: {self.imports}")
+        self.server = await Server.create(imports=['Init'] + self.imports, project_path=self.project_path)
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+    async def healthy(self) -> bool:
+        try:
+            result = await asyncio.wait_for(self.server.run_async('stat', {}), 10)
+            return 'error' not in result
+        except Exception as e:
+            print(f"Lean worker failed health check: {e}")
+            return False
+
+    def memory(self) -> int:
+        try:
+            return process_tree_rss(self.server.proc.pid)
+        except Exception:
+            return 0
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server._close()
+            except Exception as e:
+                print(f"Error closing Lean worker: {e}")
+        self.server = None
+
+
+class WarmPool:
+    """
+    Pool of long-lived Lean workers, each keeping an import header loaded,
+    so that a submission only pays for elaborating its body.
+
+    `headers` are kept loaded for the lifetime of the pool; `start()` warms them up.
+    Other import sets are only served on request (`worker(imports, create=True)`),
+    and the least recently used of those are closed once there are more than
+    `max_import_sets`. A worker is restarted after `max_uses` uses, or when its
+    memory use passes `max_memory` bytes, and is health-checked before reuse
+    if it has been idle for more than `health_interval` seconds.
+    A check that takes longer than `timeout` seconds (by default leanrunner's configured timeout,
+    or DEFAULT_TIMEOUT) fails with `limit: 'timeout'`, and its worker is restarted.
+    The pool can be used from successive event loops (e.g. one `asyncio.run` per chat message),
+    but not from several at the same time.
+    """
+    def __init__(self, headers=DEFAULT_HEADERS, workers_per_header: int = 1, project_path: str = '.', timeout: Optional[float] = None,
+                 max_import_sets: int = 4, max_uses: int = 200, max_memory: Optional[int] = 16 * 1024**3, health_interval: float = 60):
+        self.headers = {header_key(h): list(h) for h in headers}
+        self.workers_per_header = workers_per_header
+        self.project_path = project_path
+        self.timeout = timeout
+        self.max_import_sets = max_import_sets
+        self.max_uses = max_uses
+        self.max_memory = max_memory
+        self.health_interval = health_interval
+        # import sets, in order from least to most recently used
+        self._idle: OrderedDict[frozenset, asyncio.Queue] = OrderedDict()
+        # number of workers of each import set that are checked out, being restarted, or waited for
+        self._users: Dict[frozenset, int] = {}
+        # workers added to import sets by `scaled`, and those still to be closed once they are released
+        self._extra: Dict[frozenset, int] = {}
+        self._surplus: Dict[frozenset, int] = {}
+        # event loop that the queues are used from
+        self._loop = None
+        for imports in self.headers.values():
+            self._add_import_set(imports)
+
+    def _add_import_set(self, imports) -> asyncio.Queue:
+        q = asyncio.Queue()
+        for _ in range(self.workers_per_header):
+            q.put_nowait(LeanWorker(list(imports), self.project_path))
+        self._idle[header_key(imports)] = q
+        self._evict(keep=header_key(imports))
+        return q
+
+    def _evict(self, keep: Optional[frozenset] = None):
+        """
+        Close the least recently used import sets beyond `max_import_sets`. Import sets in use are skipped,
+        so that nobody waits on an evicted queue; they are evicted later, once they are no longer in use.
+        """
+        unpinned = [k for k in self._idle if k not in self.headers]
+        excess = len(unpinned) - self.max_import_sets
+        for key in unpinned:
+            if excess <= 0:
+                break
+            if key == keep or self._users.get(key):
+                continue
+            print(f"Evicting Lean workers for imports {sorted(key)}")
+            old = self._idle.pop(key)
+            self._extra.pop(key, None)
+            self._surplus.pop(key, None)
+            while not old.empty():
+                old.get_nowait().close()
+            excess -= 1
+
+    def _bind_loop(self):
+        """
+        Move the idle workers to new queues when the pool is used from a new event loop, since a queue binds
+        to the first loop that waits on it. Counts left by the tasks of the previous loop are reset.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        if self._loop is not None:
+            for key, old in list(self._idle.items()):
+                q = asyncio.Queue()
+                while not old.empty():
+                    q.put_nowait(old.get_nowait())
+                self._idle[key] = q
+            self._users.clear()
+            self._extra.clear()
+            self._surplus.clear()
+        self._loop = loop
+
+    def _use(self, key: frozenset, n: int):
+        self._users[key] = self._users.get(key, 0) + n
+        if not self._users[key]:
+            del self._users[key]
+            self._evict()
+
+    def effective_timeout(self, timeout: Optional[float] = None) -> float:
+        return timeout or self.timeout or leanrunner.default_runner.timeout or DEFAULT_TIMEOUT
+
+    def has_header(self, imports) -> bool:
+        return header_key(imports) in self.headers
+
+    async def start(self, extra_headers=[]):
+        """Start every worker, and workers for `extra_headers`, so that the first submissions are already warm."""
+        self._bind_loop()
+        for h in extra_headers:
+            if header_key(h) not in self._idle:
+                self._add_import_set(h)
+        workers = []
+        for q in self._idle.values():
+            while not q.empty():
+                workers.append((q, q.get_nowait()))
+        try:
+            await asyncio.gather(*[w.start() for q, w in workers if w.server is None])
+        finally:
+            for q, w in workers:
+                q.put_nowait(w)
+
+    async def _ready(self, worker: LeanWorker):
+        if worker.server is not None and time.monotonic() - worker.last_used > self.health_interval:
+            if not await worker.healthy():
+                worker.close()
+        if worker.server is None:
+            await worker.start()
+
+    def _worn_out(self, worker: LeanWorker) -> bool:
+        if worker.uses >= self.max_uses:
+            return True
+        return self.max_memory is not None and worker.memory() > self.max_memory
+
+    async def _restart(self, key: frozenset, worker: LeanWorker, q: asyncio.Queue):
+        worker.close()
+        try:
+            await worker.start()
+        except Exception as e:
+            print(f"Failed to restart Lean worker: {e}")
+            worker.close()
+        q.put_nowait(worker)
+        self._use(key, -1)
+
+    def _release(self, key: frozenset, q: asyncio.Queue, worker: LeanWorker):
+        if self._idle.get(key) is not q:
+            # the import set was evicted while the worker was busy
+            worker.close()
+        elif self._surplus.get(key):
+            # an extra worker of `scaled` that is no longer needed
+            self._surplus[key] -= 1
+            worker.close()
+        elif worker.server is not None and self._worn_out(worker):
+            print(f"Recycling Lean worker for imports {worker.imports} after {worker.uses} uses")
+            self._use(key, 1)
+            asyncio.create_task(self._restart(key, worker, q))
+        else:
+            q.put_nowait(worker)
+
+    @contextlib.asynccontextmanager
+    async def worker(self, imports, create: bool = False):
+        """
+        Hold a ready worker with the given imports loaded. Yields None if the
+        import set is not in the pool and `create` is False.
+        """
+        self._bind_loop()
+        key = header_key(imports)
+        q = self._idle.get(key)
+        if q is None and create:
+            q = self._add_import_set(list(imports))
+        if q is None:
+            yield None
+            return
+        self._idle.move_to_end(key)
+        self._use(key, 1)
+        try:
+            worker = await q.get()
+            try:
+                await self._ready(worker)
+                yield worker
+                worker.uses += 1
+                worker.last_used = time.monotonic()
+                await worker.server.gc_async()
+            except BaseException:
+                # the server may be in the middle of a command; don't hand it out again
+                worker.close()
+                raise
+            finally:
+                self._release(key, q, worker)
+        finally:
+            self._use(key, -1)
+
+    @contextlib.asynccontextmanager
+    async def scaled(self, imports, n: int):
+        """
+        Keep at least `n` workers for the import set while in the context, e.g. for a batch of checks
+        sharing the header, so that they run in parallel. The extra workers start when first used,
+        and are closed when the context ends.
+        """
+        self._bind_loop()
+        key = header_key(imports)
+        q = self._idle.get(key)
+        if q is None:
+            q = self._add_import_set(list(imports))
+        self._use(key, 1)
+        added = max(0, n - self.workers_per_header - self._extra.get(key, 0))
+        for _ in range(added):
+            q.put_nowait(LeanWorker(list(imports), self.project_path))
+        self._extra[key] = self._extra.get(key, 0) + added
+        try:
+            yield
+        finally:
+            if self._idle.get(key) is q:
+                self._extra[key] -= added
+                self._surplus[key] = self._surplus.get(key, 0) + added
+                while self._surplus[key] and not q.empty():
+                    q.get_nowait().close()
+                    self._surplus[key] -= 1
+            self._use(key, -1)
+
+    async def check(self, code: str, json_output: bool = False, timeout: Optional[float] = None,
+                    sorrys: bool = False, create: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Check code on a warm worker. Returns a result dict in the format of
+        `leantool.check_lean_code`, or None if the header is not pooled or the
+        worker failed, in which case the caller should fall back to a cold run.
+        If the check times out, the result is a failure with `limit: 'timeout'`:
+        a cold run of the same code would most likely time out too.
+        With `sorrys`, the same elaboration also extracts the goal state of each
+        `sorry`; the Pantograph compilation units are returned in `sorry_units`.
+        With `create`, a worker is started for import sets that are not pooled yet.
+        The elaboration holds a slot of leanrunner's default runner, so warm checks count
+        towards its limit on concurrent Lean processes.
+        """
+        imports, body = split_header(code)
+        if not (create or self.has_header(imports)):
+            return None
+        timeout = self.effective_timeout(timeout)
+        timed_out = False
+        try:
+            async with self.worker(imports, create=create) as worker, leanrunner.default_runner.slot() as slot:
+                try:
+                    if sorrys:
+                        units = await asyncio.wait_for(worker.server.load_sorry_async(body), timeout)
+                    else:
+                        units = await asyncio.wait_for(worker.server.check_compile_async(body), timeout)
+                except asyncio.TimeoutError:
+                    # leaving the worker context with an exception closes the worker, stopping the elaboration
+                    timed_out = True
+                    raise
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if timed_out:
+                return {
+                    "success": False,
+                    "output": [] if json_output else '',
+                    "error": f"Lean timed out after {timeout:g} seconds.",
+                    "limit": 'timeout',
+                    "queue_depth": slot["queue_depth"],
+                    "queue_wait": round(slot["queue_wait"], 3)
+                }
+            print(f"Warm Lean worker failed, falling back to a cold run: {e!r}")
+            return None
+        messages = [m for u in units for m in u.messages]
+        success = not any(leandiag.is_error(m) for m in messages)
+        if json_output:
+            output = [message_to_json(m) for m in messages]
+        else:
+            output = ''.join(m if m.endswith('\n') else m + '\n' for m in messages)
+        result = {
+            "success": success,
+            "output": output,
+            "error": '' if not success else None,
+            "queue_depth": slot["queue_depth"],
+            "queue_wait": round(slot["queue_wait"], 3)
+        }
+        if sorrys:
+            result['sorry_units'] = units
+        return result
+
+    def close(self):
+        for q in self._idle.values():
+            workers = []
+            while not q.empty():
+                workers.append(q.get_nowait())
+            for w in workers:
+                w.close()
+                q.put_nowait(w)
+
+
+# Pool used by `leantool.check_lean_code` and the LoadSorry plugin when no pool is passed explicitly.
+# Without pinned headers, checks use a new Lean process, and only LoadSorry keeps servers warm.
+default_pool: WarmPool = WarmPool(headers=[])
+
+
+def set_default_pool(pool: WarmPool):
+    global default_pool
+    default_pool = pool
@@ -0,0 +1,239 @@
+import asyncio
+import contextlib
+import os
+import re
+import signal
+import tempfile
+import time
+import weakref
+from typing import Dict, List, Optional, Any
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Rough peak memory of one `lake env lean` run with `import Mathlib`
+MEMORY_PER_RUN = 4 * 1024**3
+
+# Name of the file that `run_lean` checks, as it appears in Lean's messages
+SOURCE_NAME = 'Main.lean'
+
+# Lean's messages when it stops because of a heartbeat limit, or an allocation fails
+HEARTBEATS_RE = re.compile(r"maximum number of heartbeats \(\d+\) has been reached")
+OUT_OF_MEMORY_RE = re.compile(r"out of memory|std::bad_alloc|failed to allocate")
+
+
+def default_concurrency() -> int:
+    """
+    Number of Lean processes allowed to run at the same time: one per core,
+    but no more than the machine's RAM can hold. Can be overridden with the
+    environment variable LEANTOOL_MAX_CONCURRENCY.
+    """
+    if os.environ.get('LEANTOOL_MAX_CONCURRENCY'):
+        return max(1, int(os.environ['LEANTOOL_MAX_CONCURRENCY']))
+    cores = os.cpu_count() or 1
+    try:
+        mem = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return cores
+    return max(1, min(cores, mem // MEMORY_PER_RUN))
+
+
+def kill_process_tree(proc):
+    """Kill a process started by `LeanRunner.run` together with its children."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class ResourceLimits:
+    """
+    Limits on each process started by a runner, besides its wall-clock timeout.
+    `cpu_time` is in seconds (RLIMIT_CPU). `memory` is in bytes of private writable memory (RLIMIT_DATA):
+    unlike the address space (RLIMIT_AS), it does not count the memory-mapped .olean files of the imports,
+    which are several GB for Mathlib. The rlimits apply to each process of the tree (lake and lean),
+    and are only enforced on Unix. `heartbeats` sets Lean's maxHeartbeats option (in thousands,
+    as in `set_option maxHeartbeats`) for Lean runs; code can still raise it with `set_option`.
+    """
+    def __init__(self, cpu_time: Optional[float] = None, memory: Optional[int] = None, heartbeats: Optional[int] = None):
+        self.cpu_time = cpu_time
+        self.memory = memory
+        self.heartbeats = heartbeats
+
+    def preexec(self):
+        """Set the rlimits in a child process, before it runs the command."""
+        if self.cpu_time:
+            # SIGXCPU at the soft limit, SIGKILL at the hard limit if it is ignored
+            resource.setrlimit(resource.RLIMIT_CPU, (int(self.cpu_time), int(self.cpu_time) + 5))
+        if self.memory:
+            resource.setrlimit(resource.RLIMIT_DATA, (self.memory, self.memory))
+
+    def limit_hit(self, returncode: Optional[int], stdout: str, stderr: str) -> Optional[str]:
+        """Which rlimit stopped a process that finished with this return code and output: 'cpu_time', 'oom' or None."""
+        # killed by a signal: negative when signaled directly, 128 + signal as reported by lake for lean
+        signals = {returncode, None if returncode is None else 128 - returncode}
+        if self.cpu_time and {-signal.SIGXCPU, -signal.SIGKILL} & signals:
+            return 'cpu_time'
+        if self.memory and returncode != 0 and (-signal.SIGKILL in signals or
+                                                OUT_OF_MEMORY_RE.search(stderr) or OUT_OF_MEMORY_RE.search(stdout)):
+            return 'oom'
+        return None
+
+
+async def _read_stream(stream, chunks: List[bytes]):
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+
+
+class LeanRunner:
+    """
+    Runs Lean processes with non-blocking asyncio subprocesses,
+    with a global limit on the number of processes running at the same time.
+    The limit is kept by a semaphore for each event loop, so that the runner can be used
+    from successive `asyncio.run` calls, e.g. one per chat message.
+    """
+    def __init__(self, max_concurrency: Optional[int] = None, timeout: Optional[float] = None, limits: Optional[ResourceLimits] = None):
+        self.max_concurrency = max_concurrency or default_concurrency()
+        self.timeout = timeout
+        self.limits = limits
+        self._sems = weakref.WeakKeyDictionary()
+        self.waiting = 0
+        self.running = 0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # a semaphore binds to the first event loop that waits on it
+        loop = asyncio.get_running_loop()
+        if loop not in self._sems:
+            self._sems[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._sems[loop]
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """
+        Hold one of the runner's slots, e.g. while a warm Lean process elaborates, so that it counts
+        towards the limit on concurrent Lean processes. Yields a dict with queue_depth and queue_wait (see `run`).
+        """
+        sem = self._semaphore()
+        queue_depth = self.waiting
+        self.waiting += 1
+        t0 = time.monotonic()
+        try:
+            await sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            yield {"queue_depth": queue_depth, "queue_wait": time.monotonic() - t0}
+        finally:
+            self.running -= 1
+            sem.release()
+
+    async def run(self, cmd: List[str], timeout: Optional[float] = None, input: Optional[str] = None,
+                  limits: Optional[ResourceLimits] = None) -> Dict[str, Any]:
+        """
+        Run a command once a slot is free, under `limits` (by default the runner's). On timeout or cancellation,
+        the whole process tree is killed. Returns a dict with
+            - returncode: the exit code, or None if the process was killed
+            - stdout, stderr: the (possibly partial) output
+            - timed_out: whether the wall-clock timeout was hit
+            - limit: the limit that stopped the process, 'timeout', 'cpu_time' or 'oom', or None
+            - queue_depth: number of runs waiting for a slot when this one arrived
+            - queue_wait: seconds spent waiting for a slot
+            - elapsed: seconds spent running the process
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if limits is None:
+            limits = self.limits
+        preexec = limits.preexec if limits is not None and resource is not None else None
+        async with self.slot() as slot:
+            t1 = time.monotonic()
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,
+                preexec_fn=preexec
+            )
+            out, err = [], []
+            readers = asyncio.gather(_read_stream(proc.stdout, out), _read_stream(proc.stderr, err))
+            finished = asyncio.gather(readers, proc.wait())
+            timed_out = False
+            try:
+                if input is not None:
+                    try:
+                        proc.stdin.write(input.encode('utf-8'))
+                        await proc.stdin.drain()
+                        proc.stdin.close()
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+                await asyncio.wait_for(asyncio.shield(finished), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                kill_process_tree(proc)
+            except BaseException:
+                kill_process_tree(proc)
+                await asyncio.wait([finished])
+                raise
+            await readers
+            returncode = await proc.wait()
+            stdout = b''.join(out).decode('utf-8', errors='replace')
+            stderr = b''.join(err).decode('utf-8', errors='replace')
+            limit = None
+            if timed_out:
+                limit = 'timeout'
+            elif limits is not None and returncode != 0:
+                limit = limits.limit_hit(returncode, stdout, stderr)
+            return {
+                "returncode": None if timed_out else returncode,
+                "stdout": stdout,
+                "stderr": stderr,
+                "timed_out": timed_out,
+                "limit": limit,
+                "queue_depth": slot["queue_depth"],
+                "queue_wait": slot["queue_wait"],
+                "elapsed": time.monotonic() - t1,
+            }
+
+    async def run_lean(self, code: str, args: List[str] = [], timeout: Optional[float] = None,
+                       limits: Optional[ResourceLimits] = None) -> Dict[str, Any]:
+        """
+        Write code to a temporary file and run `lake env lean` on it. Besides the limits of `run`,
+        `limit` is 'heartbeats' if Lean stopped an elaboration at its maximum number of heartbeats.
+        The file is named SOURCE_NAME in its own temporary directory, and the directory is removed from
+        the output, so that the same code gives the same output on every run.
+        """
+        if limits is None:
+            limits = self.limits
+        if limits is not None and limits.heartbeats:
+            args = [f'-DmaxHeartbeats={limits.heartbeats}'] + list(args)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_path = os.path.join(temp_dir, SOURCE_NAME)
+            with open(temp_path, 'w', encoding='utf-8') as temp_file:
+                temp_file.write(code)
+            result = await self.run(['lake', 'env', 'lean'] + args + [temp_path], timeout=timeout, limits=limits)
+        for stream in ['stdout', 'stderr']:
+            result[stream] = result[stream].replace(temp_path, SOURCE_NAME)
+        if result['limit'] is None and HEARTBEATS_RE.search(result['stdout']):
+            result['limit'] = 'heartbeats'
+        return result
+
+
+default_runner = LeanRunner()
+
+
+def configure(max_concurrency: Optional[int] = None, timeout: Optional[float] = None, limits: Optional[ResourceLimits] = None):
+    """Replace the process-wide runner, e.g. from a server's command line options."""
+    global default_runner
+    default_runner = LeanRunner(max_concurrency, timeout, limits)
+
+
+async def run_lean(code: str, args: List[str] = [], timeout: Optional[float] = None,
+                   limits: Optional[ResourceLimits] = None) -> Dict[str, Any]:
+    return await default_runner.run_lean(code, args, timeout, limits)
@@ -1,15 +1,20 @@
 import sys
 import asyncio
-import subprocess
+import contextlib
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from litellm import completion, acompletion
-import tempfile
-import os
 import re
+import time
 import traceback
+import inspect
 
 import litellm
+import leancache
+import leandiag
+import leanpool
+import leanrunner
+import ratelimit
 litellm.set_verbose=True
 litellm.drop_params=True
 
@@ -144,9 +149,177 @@ def extract_imports(code: str):
             rest+=ln
     return imports, rest
 
+async def emit_event(on_event, event: Dict[str, Any]):
+    """Call an `on_event` callback of `interactive_lean_check`, which can be a plain function or a coroutine function."""
+    if on_event is None:
+        return
+    r = on_event(event)
+    if inspect.isawaitable(r):
+        await r
+
 def strip_reasoning(messages):
     return [{k:v for k,v in m.items() if k!='reasoning_content'} for m in messages]
 
+def summarize_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Errors-only summary of a check_lean_code result, used for older attempts in the conversation."""
+    output = result.get('output')
+    if isinstance(output, (str, list)):
+        output = leandiag.errors_only(output)
+    return {
+        'success': result.get('success'),
+        'output': output,
+        'error': result.get('error'),
+        'note': 'result of an older attempt, only the errors are kept'
+    }
+
+# Keys of a check_lean_code result that describe the run rather than the code. They are left out of
+# the conversation, which is part of the LLM cache key, so that replays don't depend on server load.
+RUN_METADATA = ['queue_depth', 'queue_wait', 'cache', 'elapsed']
+
+def format_result_content(result: Dict[str, Any], plain_text_mode: bool) -> str:
+    """The content of the message that reports a Lean result to the LLM."""
+    if not plain_text_mode:
+        return json.dumps({k: v for k, v in result.items() if k not in RUN_METADATA})
+    output=f"Given your code, Lean outputs the following:\n{result['output']}"
+    if result['error']:
+        output+=f"\nError message:\n{result['error']}"
+    return output
+
+def estimate_tokens(message: Dict[str, Any]) -> int:
+    return len(json.dumps(message, default=str)) // 4
+
+def supports_cache_breakpoints(model: str) -> bool:
+    """Whether the model's provider needs explicit `cache_control` breakpoints for prompt caching (OpenAI-style providers cache prefixes automatically)."""
+    return 'anthropic' in model or 'claude' in model
+
+def add_usage(usage: Dict[str, Any], response, elapsed: float, cached_response: bool = False):
+    """Add the token counts of an LLM response, including prompt cache reads and writes, to the totals in `usage`."""
+    u = getattr(response, 'usage', None)
+    details = getattr(u, 'prompt_tokens_details', None)
+    turn = {
+        'prompt_tokens': getattr(u, 'prompt_tokens', 0) or 0,
+        'completion_tokens': getattr(u, 'completion_tokens', 0) or 0,
+        'cached_tokens': getattr(details, 'cached_tokens', None) or getattr(u, 'cache_read_input_tokens', 0) or 0,
+        'cache_creation_tokens': getattr(u, 'cache_creation_input_tokens', 0) or 0,
+        'time': elapsed,
+        'cached_response': cached_response,
+    }
+    for k in ['prompt_tokens', 'completion_tokens', 'cached_tokens', 'cache_creation_tokens']:
+        usage[k] = usage.get(k, 0) + turn[k]
+    usage.setdefault('turns', []).append(turn)
+
+class CompactionPolicy:
+    """
+    How the conversation sent to the LLM is kept bounded. The `keep_recent` most recent Lean
+    results are sent in full and older ones are reduced to their errors (see `summarize_result`),
+    `batch` at a time: compacting a result changes the prompt prefix that the provider has cached,
+    so results are compacted together every few turns rather than one per turn.
+    If the prompt is still over the model's token budget (`token_budgets[model]`, or `default_budget`),
+    older results are dropped and older assistant messages are cut to `max_assistant_chars`,
+    oldest first, always keeping the last `keep_recent` exchanges.
+    """
+    def __init__(self, keep_recent: int = 2, token_budgets: Optional[Dict[str, int]] = None,
+                 default_budget: int = 100000, max_assistant_chars: int = 2000, batch: int = 2):
+        self.keep_recent = keep_recent
+        self.batch = batch
+        self.token_budgets = token_budgets or {}
+        self.default_budget = default_budget
+        self.max_assistant_chars = max_assistant_chars
+
+    def budget(self, model: str) -> int:
+        return self.token_budgets.get(model, self.default_budget)
+
+class LLMHistory:
+    """
+    The messages sent to the LLM for one conversation: a copy of `messages` without reasoning content,
+    extended with the new messages on each turn instead of being rebuilt, and compacted by the policy.
+    `messages` itself is not modified, so it keeps the full history.
+    With `cache_breakpoints`, prompt cache breakpoints are placed on the last system message, on the
+    last message before the new request (e.g. loaded files, or the previous conversation), and on the
+    latest message, which moves every turn so that each turn reads the prefix cached by the one before.
+    With compaction, one more breakpoint stays just before the oldest result not compacted yet, where
+    an earlier turn's rolling breakpoint was, so the turn that compacts it still reads the prefix before it.
+    """
+    def __init__(self, messages: List[Dict[str, Any]], model: str, policy: Optional[CompactionPolicy], plain_text_mode: bool,
+                 cache_breakpoints: bool = False):
+        self.messages = messages
+        self.model = model
+        self.policy = policy
+        self.plain_text_mode = plain_text_mode
+        self.cache_breakpoints = cache_breakpoints
+        system = [i for i, m in enumerate(messages) if m['role'] == 'system']
+        self.fixed_breakpoints = {i for i in [system[-1] if system else -1, len(messages) - 2] if i >= 0}
+        self.rolling_breakpoint = None
+        self.stable_breakpoint = None
+        self.llm_messages: List[Dict[str, Any]] = []
+        self.tokens: List[int] = []
+        self.total = 0
+        # index of each message that reports a Lean result, and the result
+        self.results: List[tuple] = []
+        self.compacted = 0
+
+    def add_result(self, result: Dict[str, Any]):
+        """Record that the last message of the conversation reports this Lean result."""
+        self.results.append((len(self.messages) - 1, result))
+
+    def _set(self, i: int, message: Dict[str, Any]):
+        tokens = estimate_tokens(message)
+        self.total += tokens - self.tokens[i]
+        self.tokens[i] = tokens
+        self.llm_messages[i] = message
+
+    def prompt(self) -> List[Dict[str, Any]]:
+        for m in strip_reasoning(self.messages[len(self.llm_messages):]):
+            if self.cache_breakpoints:
+                # at most 4 breakpoints are allowed; only the ones placed here are kept
+                m.pop('cache_control', None)
+                if len(self.llm_messages) in self.fixed_breakpoints:
+                    m['cache_control'] = {'type': 'ephemeral'}
+            self.llm_messages.append(m)
+            self.tokens.append(estimate_tokens(m))
+            self.total += self.tokens[-1]
+        if self.cache_breakpoints:
+            last = len(self.llm_messages) - 1
+            if self.rolling_breakpoint not in (None, last):
+                self.llm_messages[self.rolling_breakpoint].pop('cache_control', None)
+            if last not in self.fixed_breakpoints:
+                self.llm_messages[last]['cache_control'] = {'type': 'ephemeral'}
+                self.rolling_breakpoint = last
+        if not self.policy:
+            return self.llm_messages
+        old_results = self.results[:max(0, len(self.results) - self.policy.keep_recent)]
+        pending = old_results[self.compacted:]
+        if len(pending) >= self.policy.batch or (pending and self.total > self.policy.budget(self.model)):
+            for i, result in pending:
+                self._set(i, dict(self.llm_messages[i], content=format_result_content(summarize_result(result), self.plain_text_mode)))
+            self.compacted = len(old_results)
+        if self.total > self.policy.budget(self.model):
+            # older than the last keep_recent exchanges (assistant message and result)
+            recent = old_results[-1][0] + 1 if old_results else 0
+            old_indices = {j for j, _ in old_results}
+            for i in range(recent):
+                if self.total <= self.policy.budget(self.model):
+                    break
+                m = self.llm_messages[i]
+                if i in old_indices:
+                    self._set(i, dict(m, content='(Lean output of an older attempt omitted)'))
+                elif m['role'] == 'assistant' and isinstance(m.get('content'), str) and len(m['content']) > self.policy.max_assistant_chars:
+                    self._set(i, dict(m, content=m['content'][:self.policy.max_assistant_chars] + '\n(rest omitted)'))
+        if self.cache_breakpoints:
+            self._place_stable_breakpoint()
+        return self.llm_messages
+
+    def _place_stable_breakpoint(self):
+        # the message before the assistant message that the oldest uncompacted result answers
+        stable = self.results[self.compacted][0] - 2 if self.compacted < len(self.results) else None
+        if stable is not None and (stable < 0 or stable in self.fixed_breakpoints or stable == self.rolling_breakpoint):
+            stable = None
+        if self.stable_breakpoint not in (None, stable, self.rolling_breakpoint) and self.stable_breakpoint not in self.fixed_breakpoints:
+            self.llm_messages[self.stable_breakpoint].pop('cache_control', None)
+        if stable is not None:
+            self.llm_messages[stable]['cache_control'] = {'type': 'ephemeral'}
+        self.stable_breakpoint = stable
+
 def result_has_sorry(result):
     if isinstance(result['output'], str):
         return 'sorry' in result['output']
@@ -156,6 +329,67 @@ def result_has_sorry(result):
                 return True
         return False
 
+# A complete block of code in plain-text mode; generation can stop once one has been written
+PLAIN_TEXT_BLOCK_RE = re.compile(r"<(Try|Result)>.*?</\1>", re.DOTALL)
+
+async def collect_stream(stream, messages, model: str = '') -> litellm.ModelResponse:
+    """
+    Read a streamed plain-text mode completion until its text has a complete <Try> or <Result> block,
+    then close the stream, so that the rest is neither generated nor waited for.
+    Returns the response built from the chunks, with the text cut after the block.
+    A stream without any chunks raises litellm.APIConnectionError, which the rate limiter retries.
+    """
+    chunks = []
+    content = ''
+    end = None
+    try:
+        async for chunk in stream:
+            chunks.append(chunk)
+            delta = chunk.choices[0].delta if chunk.choices else None
+            content += getattr(delta, 'content', None) or ''
+            match = PLAIN_TEXT_BLOCK_RE.search(content)
+            if match:
+                end = match.end()
+                break
+    finally:
+        close = getattr(stream, 'aclose', None)
+        if end is not None and close is not None:
+            try:
+                await close()
+            except Exception as e:
+                print(f"Error closing LLM stream: {e}")
+    response = litellm.stream_chunk_builder(chunks, messages=messages)
+    if response is None:
+        raise litellm.APIConnectionError(message="The LLM stream ended without any chunks",
+                                         llm_provider=ratelimit.provider_of(model), model=model)
+    if end is not None:
+        response.choices[0].message.content = content[:end]
+        response.choices[0].finish_reason = 'stop'
+    return response
+
+def requested_check(message, plain_text_mode: bool) -> Optional[Dict[str, Any]]:
+    """The arguments of the Lean check that an LLM message asks for, or None if it gives a final result or asks for something else."""
+    content = getattr(message, 'content', None)
+    if content and re.search(r"<Result>(.*?)</Result>", content, re.DOTALL):
+        return None
+    tool_calls = getattr(message, 'tool_calls', None)
+    if tool_calls:
+        if tool_calls[0].function.name != 'check_lean_code':
+            return None
+        return json.loads(tool_calls[0].function.arguments)
+    if plain_text_mode and content:
+        match = re.search(r"<Try>(.*?)</Try>", content, re.DOTALL)
+        if match:
+            return {'code': match.group(1).strip()}
+    return None
+
+def result_rank(result):
+    """Sort key of Lean results, best first: successes without sorry, other successes, then by number of errors."""
+    output = result.get('output')
+    errors = leandiag.errors_only(output) if isinstance(output, (str, list)) else []
+    n_errors = len(leandiag.split_messages(errors)) if isinstance(errors, str) else len(errors)
+    return (not result['success'], result_has_sorry(result), n_errors)
+
 class LeanFeatures:
     def __init__(self):
         self.sys_msg = SYSTEM_MESSAGE_FEATURES
@@ -163,51 +397,218 @@ class LeanFeatures:
         return result
 
 class LoadSorry:
-    def __init__(self):
+    def __init__(self, pool=None, single_pass=False):
         self.sys_msg = SYSTEM_MESSAGE_LOAD_SORRY
+        # leanpool.WarmPool to get Pantograph servers from; defaults to leanpool.default_pool
+        self.pool = pool
+        # If True, check_lean_code elaborates code containing `sorry` once with Pantograph,
+        # getting both Lean's messages and the goal states, instead of running Lean and then Pantograph
+        self.single_pass = single_pass
     async def process(self, code, result):
+        units = result.pop('sorry_units', None)
         has_sorry =result_has_sorry(result)
         if result['success'] and has_sorry:
             print ("Plugin LoadSorry activated")
-            from pantograph import Server
-            imports, rest=extract_imports(code)
-            print (f"Creating server. Imports: {imports}")
-            server=await Server.create(imports=['Init']+imports, project_path=".")
-            print(f"Server created. Loading sorrys")
-            units =await server.load_sorry_async(rest)
-            print("Sorrys loaded")
-            states = [ u.goal_state if u.goal_state is not None or len(u.messages)==0 else 'Error extracting goal state: '+'\n'.join(u.messages) for u in units]
-            output = f"\nGoal States from sorrys:\n"+"\n\n".join([str(s) for s in states if s])
+            if units is None:
+                imports, rest=extract_imports(code)
+                pool = self.pool or leanpool.default_pool
+                print (f"Getting server. Imports: {imports}")
+                timeout = pool.effective_timeout()
+                try:
+                    async with pool.worker(imports, create=True) as worker:
+                        print(f"Server ready. Loading sorrys")
+                        units =await asyncio.wait_for(worker.server.load_sorry_async(rest), timeout)
+                        print("Sorrys loaded")
+                        output = self.format_goals(units)
+                except asyncio.TimeoutError:
+                    output = f"\nGoal States from sorrys: not available, Pantograph timed out after {timeout:g} seconds."
+                    # not a complete result, so that it is not cached
+                    result['limit'] = 'timeout'
+            else:
+                output = self.format_goals(units)
             if isinstance(result['output'], str):
                 result['output'] += output
             else:
                 result['output'].append({'goals': output})
-            server._close()
         return result
+    def format_goals(self, units):
+        states = [ u.goal_state if u.goal_state is not None or len(u.messages)==0 else 'Error extracting goal state: '+'\n'.join(u.messages) for u in units]
+        return f"\nGoal States from sorrys:\n"+"\n\n".join([str(s) for s in states if s])
 
 
+SORRY_RE = re.compile(r'\bsorry\b')
+# The error that LeanTool/CheckFalse.lean reports when it proves the negation of the goal
+DISPROOF_MARKER = 'Goal is false! Proof of negation'
+HOLE_RE = re.compile(r'hole_hammer (\d+): (?:closed by tactic (\d+)|failed)')
+
 class SorryHammer:
-    def __init__(self, tactic = 'hammer', imports = 'import Hammer\n', greedy=False, try_negation=True):
-        self.tactic = tactic if isinstance(tactic, str) else "first | " + " | ".join(['('+t+')' for t in tactic])
+    def __init__(self, tactic = 'hammer', imports = 'import Hammer\n', greedy=False, try_negation=True, race=False, adaptive=False, all_holes=False):
+        self.tactics = [tactic] if isinstance(tactic, str) else list(tactic)
+        self.tactic = tactic if isinstance(tactic, str) else self.first_of(self.tactics)
         self.imports = imports
         self.greedy = greedy
         self.try_negation = try_negation
+        # If True, each tactic of a portfolio is run in its own Lean process at the same time,
+        # the first success wins and the other runs are cancelled
+        self.race = race
+        # If True, the portfolio is ordered by the tactics' win rates and latencies recorded in self.stats
+        self.adaptive = adaptive
+        self.stats = {t: {'attempts': 0, 'finished': 0, 'successes': 0, 'wins': 0, 'time': 0.0} for t in self.tactics}
+        # If True, the hammer is tried at every sorry in a single Lean run (see LeanTool/HoleHammer.lean),
+        # and all the successes are spliced into the code. Replaces the recursion of `greedy`.
+        self.all_holes = all_holes
         self.sys_msg = f"""
 If the `sorry_hammer` parameter of the check_lean_code tool call is set to True,
-the tool will attempt to replace the first `sorry` in your code with a proof using a hammer tactic `{self.tactic}`.
+the tool will attempt to replace {'each' if all_holes else 'the first'} `sorry` in your code with a proof using a hammer tactic `{self.tactic}`.
 If successful, it will return the modified code in the `code` field of the result.
 Alternatively, without setting the `sorry_hammer` flag, you could manually replace a `sorry` with `{self.tactic}`, after including the imports `{self.imports}` in your code.
 """
+    @staticmethod
+    def first_of(tactics):
+        return "first | " + " | ".join(['('+t+')' for t in tactics])
+    def rank(self, t):
+        st = self.stats[t]
+        win_rate = (st['wins'] + 1) / (st['attempts'] + 2)
+        mean_time = st['time'] / st['finished'] if st['finished'] else 0.0
+        return (-win_rate, mean_time)
+    def portfolio(self):
+        return sorted(self.tactics, key=self.rank) if self.adaptive else list(self.tactics)
+    def current_tactic(self):
+        if self.adaptive and len(self.tactics) > 1:
+            return self.first_of(self.portfolio())
+        return self.tactic
+    def portfolio_stats(self):
+        """Win rate and mean latency (seconds) of each tactic, in portfolio order"""
+        return {t: {**self.stats[t],
+                    'win_rate': self.stats[t]['wins'] / self.stats[t]['attempts'] if self.stats[t]['attempts'] else None,
+                    'mean_time': self.stats[t]['time'] / self.stats[t]['finished'] if self.stats[t]['finished'] else None}
+                for t in self.portfolio()}
+    async def race_tactics(self, code):
+        """
+        Replace the first sorry with each tactic of the portfolio, and check the variants concurrently.
+        Returns the code and result of the first success, or of the last tactic in portfolio order if all fail.
+        """
+        async def attempt(t):
+            t0 = time.monotonic()
+            new_code = code.replace('sorry', t, 1)
+            new_result = await check_lean_code(new_code, sorry_hammer=self.greedy)
+            return t, new_code, new_result, time.monotonic() - t0
+        portfolio = self.portfolio()
+        tasks = [asyncio.create_task(attempt(t)) for t in portfolio]
+        finished = {}
+        winner = None
+        errors = []
+        try:
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception():
+                        errors.append(task.exception())
+                        continue
+                    t, new_code, new_result, elapsed = task.result()
+                    self.stats[t]['finished'] += 1
+                    self.stats[t]['time'] += elapsed
+                    finished[t] = (new_code, new_result)
+                    if new_result['success']:
+                        self.stats[t]['successes'] += 1
+                        if winner is None:
+                            winner = t
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for t in portfolio:
+            self.stats[t]['attempts'] += 1
+        if winner:
+            print (f"SorryHammer race won by {winner}")
+            self.stats[winner]['wins'] += 1
+            return finished[winner]
+        if not finished:
+            raise errors[0]
+        return finished[[t for t in portfolio if t in finished][-1]]
+    async def hammer_all_holes(self, code, result):
+        """
+        Try the hammer at every sorry in one Lean run, using the `hole_hammer` tactic,
+        and splice the tactics that closed their holes into the code.
+        """
+        holes = list(SORRY_RE.finditer(code))
+        portfolio = self.portfolio()
+        alternatives = ' '.join('| (' + t + ')' for t in portfolio)
+        hammer_code = code
+        for k, m in reversed(list(enumerate(holes))):
+            hammer_code = hammer_code[:m.start()] + f"(hole_hammer {k} {alternatives})" + hammer_code[m.end():]
+        if self.imports not in hammer_code:
+            hammer_code = self.imports + '\n' + hammer_code
+        hammer_code = 'import LeanTool.HoleHammer\n' + hammer_code
+        new_result = await check_lean_code(hammer_code, json_output=True, plugins=[])
+        messages = new_result['output'] if isinstance(new_result['output'], list) else []
+        closed = {}
+        for msg in messages:
+            m = HOLE_RE.match(msg.get('data', ''))
+            if m and m.group(2) is not None:
+                closed[int(m.group(1))] = (portfolio[int(m.group(2))], msg['data'].split('\n', 1)[-1].strip())
+        if closed:
+            print (f"SorryHammer closed {len(closed)} of {len(holes)} sorrys")
+            new_code = code
+            for k, m in reversed(list(enumerate(holes))):
+                if k in closed:
+                    new_code = new_code[:m.start()] + closed[k][0] + new_code[m.end():]
+            if self.imports not in new_code:
+                new_code = self.imports + '\n' + new_code
+            output = "SorryHammer successfully replaced "
+            output += "all sorrys." if len(closed) == len(holes) else "some sorrys, but some remain."
+            for k in range(len(holes)):
+                if k in closed:
+                    output += f"\nsorry #{k+1}: replaced by `{closed[k][0]}`, with proof term:\n{closed[k][1]}"
+                else:
+                    output += f"\nsorry #{k+1}: not closed"
+            if isinstance(result['output'], str):
+                result['output'] = output + '\n' + result['output']
+            else:
+                result['output'] = [{'data': output}] + result['output']
+            result['code'] = new_code
+        else:
+            print ("SorryHammer failed")
+            output = "SorryHammer failed to replace any sorry. The following is Lean's output from the attempt:"
+            lean_output = '\n'.join(msg.get('data', '') for msg in messages if not HOLE_RE.match(msg.get('data', ''))) if messages else new_result['output']
+            if isinstance(result['output'], str):
+                result['output'] += '\n' + output + '\n' + lean_output
+            else:
+                result['output'] += [{'data': output}] + [msg for msg in messages if not HOLE_RE.match(msg.get('data', ''))]
+        return result
     async def process(self, code, result):
         has_sorry = result_has_sorry(result)
-        orig_code = code
+        if result['success'] and has_sorry and self.all_holes:
+            print ("Plugin SorryHammer activated")
+            return await self.hammer_all_holes(code, result)
         if result['success'] and has_sorry:
             print ("Plugin SorryHammer activated")
             if self.imports not in code:
                 code = self.imports + '\n' + code
-            code = code.replace('sorry', self.tactic, 1)
-            new_result = await check_lean_code(code, sorry_hammer=self.greedy)
-            if new_result['success']:
+            # The proof attempt and, if enabled, the disproof attempt run at the same time.
+            # Whichever reaches a decision first (a proof, or a proof of the negation) wins and the other is cancelled.
+            hammer_task = asyncio.create_task(self.hammer_first_sorry(code))
+            cf_task = None
+            if self.try_negation:
+                cf_code = 'import LeanTool.CheckFalse\n' + code
+                cf_code = cf_code.replace('sorry', f"(check_false {self.current_tactic()})", 1)
+                cf_task = asyncio.create_task(check_lean_code(cf_code, sorry_hammer=False))
+            pending = {t for t in [hammer_task, cf_task] if t}
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    if hammer_task in done and hammer_task.result()[1]['success']:
+                        break
+                    if cf_task in done and self.disproved(cf_task.result()):
+                        break
+            finally:
+                for t in pending:
+                    t.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            hammer_done = hammer_task.done() and not hammer_task.cancelled()
+            if hammer_done and hammer_task.result()[1]['success']:
+                code, new_result = hammer_task.result()
                 print ("SorryHammer succeeded")
                 output = "SorryHammer successfully replaced "
                 if result_has_sorry(new_result):
@@ -222,24 +623,43 @@ Alternatively, without setting the `sorry_hammer` flag, you could manually repla
             else:
                 print ("SorryHammer failed")
                 output = "SorryHammer failed to replace the first sorry. The following is Lean's output from the attempt:"
+                if hammer_done:
+                    hammer_output = hammer_task.result()[1]['output']
+                else:
+                    hammer_output = "(The attempt was stopped because the goal was disproved.)"
+                    if not isinstance(result['output'], str):
+                        hammer_output = [{'data': hammer_output}]
                 if isinstance(result['output'], str):
-                    result['output'] +='\n' + output + '\n' + new_result['output']
+                    result['output'] +='\n' + output + '\n' + hammer_output
                 else:
-                    result['output']+=[{'data': output}] + new_result['output']
-                if self.try_negation:
-                    code = orig_code
-                    if self.imports not in code:
-                        code = self.imports + '\n' + code
-                    code = 'import LeanTool.CheckFalse\n' + code
-                    code = code.replace('sorry', f"(check_false {self.tactic})", 1)
-                    cf_result = await check_lean_code(code, sorry_hammer=False)
-                    if not cf_result['success']:
-                        cf_out = "SorryHammer proved that the goal corresponding to the first sorry is false. The following is the proof of the negation:"
+                    result['output']+=[{'data': output}] + hammer_output
+                cf_done = cf_task is not None and cf_task.done() and not cf_task.cancelled()
+                if cf_done and self.disproved(cf_task.result()):
+                    cf_result = cf_task.result()
+                    cf_out = "SorryHammer proved that the goal corresponding to the first sorry is false. The following is the proof of the negation:"
                     if isinstance(result['output'],str):
                         result['output']+='\n'+cf_out+'\n'+cf_result['output']
                     else:
-                        result['output']+=[{'data':output}]+cf_result['output']
+                        result['output']+=[{'data':cf_out}]+cf_result['output']
         return result
+    @staticmethod
+    def disproved(result):
+        """
+        Whether a check_false run proved the negation of the goal. Other failures (limits, missing imports,
+        other errors) are not disproofs.
+        """
+        if result['success'] or result.get('limit'):
+            return False
+        output = result['output']
+        if not isinstance(output, str):
+            output = '\n'.join(str(m.get('data', '')) for m in output)
+        return DISPROOF_MARKER in output
+    async def hammer_first_sorry(self, code):
+        """Replace the first sorry with the hammer and check the code. Returns the new code and result."""
+        if self.race and len(self.tactics) > 1:
+            return await self.race_tactics(code)
+        code = code.replace('sorry', self.current_tactic(), 1)
+        return code, await check_lean_code(code, sorry_hammer=self.greedy)
 
 
 default_plugins=[LoadSorry(), LeanFeatures(), SorryHammer()]
@@ -257,11 +677,45 @@ async def interactive_lean_check(
     plain_text_mode = False,
     debug = False,
     messages=None,
-    api_key: str = None
+    api_key: str = None,
+    pool = None,
+    on_event = None,
+    llm_cache = None,
+    compaction = CompactionPolicy(),
+    prompt_caching: Optional[bool] = None,
+    diagnostics = leandiag.DiagnosticsPolicy(),
+    candidates: int = 1,
+    sample_n: bool = False,
+    stream: bool = True
 ) -> Dict[str, Any]:
     """
     Interactively work with an LLM to generate valid Lean code, allowing for
     multiple attempts based on feedback.
+    `pool` is passed on to `check_lean_code`.
+    LLM requests go through `ratelimit.default_limiter`, which applies the per-provider rate limits and retries.
+    `llm_cache` (a leancache.LLMCache, by default leancache.default_llm_cache; False to disable) records
+    the LLM responses; in its replay mode, a request missing from the cache raises leancache.CacheMiss.
+    `compaction` is the CompactionPolicy that bounds the size of the conversation sent to the LLM
+    (None to send it in full); the returned `messages` always contain the full conversation.
+    `diagnostics` is the leandiag.DiagnosticsPolicy that shortens Lean's output in the attempts and in the
+    messages to the LLM (None for the full output); the LLM can also ask for the full output of a check.
+    With `candidates` > 1, each turn samples that many responses (concurrently, or in one request with `n=`
+    if `sample_n`, for providers that support it; use a temperature well above 0 either way). The Lean checks
+    they ask for run in parallel, and the conversation continues with the best one: the first to succeed without
+    sorry, which cancels the checks still running, or else the one with the fewest errors. The other candidates'
+    code and results are in the attempt's `candidates`.
+    In plain-text mode, with `stream`, responses are streamed and cut off as soon as they contain a complete
+    <Try> or <Result> block (see `collect_stream`), so the Lean check starts without waiting for the rest.
+    `prompt_caching` places prompt cache breakpoints (see LLMHistory); by default only for providers that need them.
+    The result's `usage` has the token counts of all LLM calls, including prompt cache reads (`cached_tokens`)
+    and writes (`cache_creation_tokens`), and each call's counts and time in `turns`.
+    `on_event`, if given, is called (and awaited if it returns an awaitable) with a dict
+    as things happen, to report progress. The dict's `type` is one of
+        - llm_turn: the LLM responded; `content` is its message text
+        - lean_check: a Lean check is starting; `attempt` is its index in the attempts, with `code` and `thought`.
+          With several candidates, it is only sent for the chosen one, once the candidates are checked.
+        - lean_result: the Lean check finished; `attempt` and `result`
+        - error: an attempt raised an exception; `attempt` and `error`
     """
     if debug:
         litellm._turn_on_debug()
@@ -290,8 +744,6 @@ async def interactive_lean_check(
                 "role": "user",
                 "content": f"The following is the conent of the file '{fn}':\n{txt}"
             })
-        #prompt caching
-        messages[-1]['cache_control']={'type': 'ephemeral'}
     messages = messages + [
         {"role": "user", "content": msg}
     ]
@@ -303,7 +755,104 @@ async def interactive_lean_check(
             tools.append(p.tool_def())
             tool_plugin[p.tool_name] = p
 
+    if llm_cache is None:
+        llm_cache = leancache.default_llm_cache
+    if prompt_caching is None:
+        prompt_caching = supports_cache_breakpoints(model)
+    history = LLMHistory(messages, model, compaction, plain_text_mode, cache_breakpoints=prompt_caching)
+    usage: Dict[str, Any] = {}
     attempts = []
+
+    async def lean_check(args, compact=True):
+        result = await check_lean_code(
+            code=prefix+args["code"],
+            json_output=args.get("json_output", False),
+            sorry_hammer=args.get("sorry_hammer", False),
+            plugins=plugins,
+            pool=pool
+        )
+        return compact_check(args, result) if compact else result
+
+    def compact_check(args, result):
+        if diagnostics and not args.get("full_output", False):
+            result = leandiag.compact_result(result, prefix+args["code"], diagnostics)
+        return result
+
+    async def streamed_completion(**kwargs):
+        # the stream is read within the rate limiter's call, so that a failed stream is retried like a failed request
+        response = await acompletion(**kwargs)
+        if kwargs.get('stream'):
+            response = await collect_stream(response, kwargs['messages'], kwargs['model'])
+        return response
+
+    async def complete(llm_messages, kwa, candidate):
+        """One LLM request, through the LLM cache and the rate limiter. Candidates after the first are cached separately."""
+        response = None
+        t_call = time.monotonic()
+        if llm_cache:
+            llm_key = llm_cache.key(model, llm_messages, dict(kwa, candidate=candidate) if candidate else kwa)
+            cached = await llm_cache.get(llm_key)
+            if cached is not None:
+                response = litellm.ModelResponse(**cached)
+                add_usage(usage, response, time.monotonic() - t_call, cached_response=True)
+        if response is None:
+            response = await ratelimit.default_limiter.completion(
+                streamed_completion,
+                model=model,
+                messages=llm_messages,
+                **kwa
+            )
+            add_usage(usage, response, time.monotonic() - t_call)
+            if llm_cache:
+                await llm_cache.put(llm_key, response.model_dump())
+        return response
+
+    async def pick_candidate(candidate_messages):
+        """
+        The candidate message to continue with, and the result of its Lean check if it was run here
+        (with the other candidates' checks). A final result wins outright; otherwise the requested checks
+        run in parallel, and the checks still running are cancelled once one succeeds without sorry.
+        Candidates are ranked on the full results, which are compacted afterwards.
+        """
+        for m in candidate_messages:
+            if m.content and re.search(r"<Result>(.*?)</Result>", m.content, re.DOTALL):
+                return m, None
+        checks = {}
+        for i, m in enumerate(candidate_messages):
+            try:
+                args = requested_check(m, plain_text_mode)
+            except json.JSONDecodeError:
+                args = None
+            if args is not None and "code" in args:
+                checks[i] = args
+        if not checks:
+            return candidate_messages[0], None
+        tasks = {asyncio.create_task(lean_check(args, compact=False)): i for i, args in checks.items()}
+        results = {}
+        errors = []
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception():
+                        errors.append(t.exception())
+                    else:
+                        results[tasks[t]] = t.result()
+                if any(r['success'] and not result_has_sorry(r) for r in results.values()):
+                    break
+        finally:
+            for t in pending:
+                t.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if not results:
+            raise errors[0]
+        best = min(results, key=lambda i: (result_rank(results[i]), i))
+        results = {i: compact_check(checks[i], r) for i, r in results.items()}
+        others = [{"code": checks[i]["code"], "result": results[i]} if i in results else {"code": checks[i]["code"], "cancelled": True}
+                  for i in checks if i != best]
+        return candidate_messages[best], {"result": results[best], "others": others}
+
     try:
         supp_parallel=litellm.supports_parallel_function_calling(model=model) 
     except Exception as e:
@@ -324,24 +873,39 @@ async def interactive_lean_check(
                 kwa['parallel_tool_calls']=False
             if model not in ['o3-mini']:
                 kwa['temperature']=temperature
-            response = await acompletion(
-                model=model,
-                messages=strip_reasoning(messages),
-                **kwa
-            )
+            llm_messages = history.prompt()
+            if sample_n and candidates > 1:
+                kwa['n'] = candidates
+            elif stream and plain_text_mode:
+                kwa['stream'] = True
+                # the token usage, for the rate limiter and the totals, comes in the last chunk
+                kwa['stream_options'] = {'include_usage': True}
+            responses = await asyncio.gather(*[complete(llm_messages, kwa, i) for i in range(1 if sample_n else candidates)],
+                                             return_exceptions=True)
+            for r in responses:
+                if isinstance(r, leancache.CacheMiss):
+                    raise r
+            choices = [c for r in responses if not isinstance(r, BaseException) for c in r.choices]
+            if not choices:
+                raise responses[0]
             
             # Check if we have a final result
 
-            message = response.choices[0].message
-            if not message:
+            candidate_messages = [c.message for c in choices if c.message]
+            if not candidate_messages:
                 return {
                     "success":False,
                     "attempts":attempts,
-                    "error":response.choices[0].finish_reason,
-                    "messages":messages
+                    "error":choices[0].finish_reason,
+                    "messages":messages,
+                    "usage":usage
                 }
+            message, checked = candidate_messages[0], None
+            if len(candidate_messages) > 1:
+                message, checked = await pick_candidate(candidate_messages)
             message_content = message.content if hasattr(message, 'content') else None
             function_call = message.tool_calls[0] if hasattr(message, 'tool_calls') and message.tool_calls else None
+            await emit_event(on_event, {"type": "llm_turn", "content": message_content})
             if message_content and "<Result>" in message_content:
                 # Extract the final result
                 match = re.search(r"<Result>(.*?)</Result>", message_content, re.DOTALL)
@@ -350,12 +914,16 @@ async def interactive_lean_check(
                     final_code = final_code.replace("```lean", "").replace("```", "")
                     if final_check:
                       # Verify the final code works
-                      final_result = await check_lean_code(final_code)
+                      await emit_event(on_event, {"type": "lean_check", "attempt": len(attempts), "code": prefix+final_code, "thought": None, "is_final": True})
+                      final_result = await check_lean_code(final_code, pool=pool)
+                      if diagnostics:
+                          final_result = leandiag.compact_result(final_result, final_code, diagnostics)
                       attempts.append({
                         "code": prefix+final_code,
                         "result": final_result,
                         "is_final": True
                       })
+                      await emit_event(on_event, {"type": "lean_result", "attempt": len(attempts)-1, "result": final_result})
                     messages.append(message.model_dump())
                     if "FAIL" in message_content:
                         success=False
@@ -366,7 +934,8 @@ async def interactive_lean_check(
                         "success": success,
                         "attempts": attempts,
                         "final_code": final_code,
-                        "messages": messages
+                        "messages": messages,
+                        "usage": usage
                     }
             
             # If we have a function call, execute it and continue the conversation
@@ -377,13 +946,10 @@ async def interactive_lean_check(
                     match = re.search(r"<Try>(.*?)</Try>", message_content, re.DOTALL)
 
                     args = {'code': match.group(1).strip()}
-                if (function_call and function_call.function.name == 'check_lean_code') or plain_text_mode:
-                  result = await check_lean_code(
-                    code=prefix+args["code"],
-                    json_output=args.get("json_output", False),
-                    sorry_hammer=args.get("sorry_hammer", False),
-                    plugins=plugins
-                  )
+                is_lean_check = (function_call and function_call.function.name == 'check_lean_code') or plain_text_mode
+                if is_lean_check:
+                  await emit_event(on_event, {"type": "lean_check", "attempt": len(attempts), "code": args["code"], "thought": message_content, "is_final": False})
+                  result = checked["result"] if checked else await lean_check(args)
                 
                   attempts.append({
                     "code": args["code"],
@@ -391,6 +957,9 @@ async def interactive_lean_check(
                     "thought": message_content,
                     "is_final": False
                   })
+                  if checked and checked["others"]:
+                    attempts[-1]["candidates"] = checked["others"]
+                  await emit_event(on_event, {"type": "lean_result", "attempt": len(attempts)-1, "result": result})
                 else:
                   p=tool_plugin.get(function_call.function.name)
                   if p:
@@ -407,20 +976,19 @@ async def interactive_lean_check(
                 #    }
                 #})
                 if plain_text_mode:
-                  output=f"Given your code, Lean outputs the following:\n{result['output']}"
-                  if result['error']:
-                    output+=f"\nError message:\n{result['error']}"
                   messages.append({
                     "role": "user",
-                    "content": output 
+                    "content": format_result_content(result, plain_text_mode)
                   })
                 else:
                   messages.append({
                     "tool_call_id": message.tool_calls[0].id,
                     "role": "tool",
                     "name": function_call.function.name,
-                    "content": json.dumps(result)
+                    "content": format_result_content(result, plain_text_mode)
                   })
+                if is_lean_check:
+                  history.add_result(result)
                 
                 continue
             
@@ -434,7 +1002,8 @@ async def interactive_lean_check(
                 return {
                         "success": False,
                         "attempts": attempts,
-                        "messages": messages
+                        "messages": messages,
+                        "usage": usage
                 }
             else:
                 tool_ins="Enclose your code in <Try> </Try> tags" if plain_text_mode else "Call the provided tool" 
@@ -442,20 +1011,21 @@ async def interactive_lean_check(
                     'role': 'user',
                     'content': f"To try your code with Lean, {tool_ins}. To finish with the final answer, enclose your final code with <Result> </Result>."
                 })
+        except leancache.CacheMiss:
+            raise
         except Exception as e:
             attempts.append({
                 "error": str(e) + '\n' + traceback.format_exc(),
                 "is_final": False
             })
-            await asyncio.sleep(1)
-        if 'anthropic' in model:
-            await asyncio.sleep(1)
+            await emit_event(on_event, {"type": "error", "attempt": len(attempts)-1, "error": attempts[-1]["error"]})
     # If we've exhausted attempts, return the history
     return {
         "success": False,
         "attempts": attempts,
         "error": f"Failed to get valid result after {max_attempts} attempts",
-        "messages": messages
+        "messages": messages,
+        "usage": usage
     }
 
 def create_lean_check_function() -> Dict[str, Any]:
@@ -483,6 +1053,10 @@ def create_lean_check_function() -> Dict[str, Any]:
                     "type": "boolean",
                     "description": "If True, the tool will attempt to replace the first `sorry` in the code with a proof using a hammer tactic. Defaults to False."
                 },
+                "full_output": {
+                    "type": "boolean",
+                    "description": "Whether to get Lean's complete output. By default, repeated messages are reported once and long output is shortened. Defaults to False."
+                },
             },
             "required": ["code"]
         }
@@ -490,69 +1064,144 @@ def create_lean_check_function() -> Dict[str, Any]:
     }
 
 
-async def check_lean_code(code: str, json_output: bool = False, sorry_hammer:bool = False, plugins = default_plugins) -> Dict[str, Any]:
+async def check_lean_code(code: str, json_output: bool = False, sorry_hammer:bool = False, plugins = default_plugins, pool = None, timeout: Optional[float] = None, cache = None, create_worker: bool = False, limits = None) -> Dict[str, Any]:
     """
     Sends code to the Lean executable and returns the results.
     
     Args:
         code: Lean code to check
         json_output: Whether to get output in JSON format
+        pool: leanpool.WarmPool to check the code on warm Lean workers, if its import header is pooled.
+              Defaults to leanpool.default_pool; pass False to always start a new Lean process.
+        create_worker: start a warm worker for the code's import header if it is not pooled yet.
+        timeout: wall-clock limit in seconds for the Lean process. Defaults to leanrunner's configured timeout.
+        limits: leanrunner.ResourceLimits (CPU time, memory, heartbeats) for the Lean process. Defaults to
+              leanrunner's configured limits. While any of these limits is set, checks start a new Lean process,
+              where the limits can be enforced, instead of using the pool; the timeout applies to both.
+              The Pantograph servers of LoadSorry are shared, so only the timeout applies to them.
+        cache: leancache.LeanCache to reuse results of identical checks.
+               Defaults to leancache.default_cache; pass False to disable.
         
     Returns:
         Dictionary containing:
             - success: bool indicating if code checked successfully
             - output: string or parsed JSON containing Lean's output
             - error: string containing error message if any
+            - queue_depth, queue_wait: number of Lean runs queued ahead of this one, and seconds waited for a slot
+            - cache: 'hit' or 'miss', if a cache is used
+            - limit: if Lean was stopped by a limit, which one: 'timeout', 'cpu_time', 'oom' or 'heartbeats'.
+              The output is what Lean printed before it was stopped.
     """
     try:
-        # Create temporary file for the Lean code
-        with tempfile.NamedTemporaryFile(suffix='.lean', mode='w', encoding='utf-8', delete=False) as temp_file:
-            temp_file.write(code)
-            temp_file_path = temp_file.name
-        
-        # Prepare command with optional JSON flag
-        cmd = ['lake', 'env', 'lean']
-        if json_output:
-            cmd.append('--json')
-        cmd.append(temp_file_path)
-        
-        # Run Lean on the temporary file
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True
-        )
-        
-        # Clean up temporary file
-        os.unlink(temp_file_path)
-        
-        # Process the output
-        success = result.returncode == 0
-        output = result.stdout
-        
-        # Parse JSON output if requested and available
-        if json_output and output:
-            try:
-                output = [json.loads(ln) for ln in output.splitlines() if ln.strip()]
-            except json.JSONDecodeError as err:
-                print(f"Failed to parse Lean JSON output: {err}.\n Keeping output as string.")
-        result = {
-            "success": success,
-            "output": output,
-            "error": result.stderr if not success else None
-        }
-        for p in plugins:
-            if hasattr(p, 'process'):
-                if sorry_hammer or not isinstance(p, SorryHammer):
-                    result=await p.process(code, result)
+        active_plugins = [p for p in plugins if hasattr(p, 'process') and (sorry_hammer or not isinstance(p, SorryHammer))]
+        if cache is None:
+            cache = leancache.default_cache
+        effective_limits = limits if limits is not None else leanrunner.default_runner.limits
+        limited = effective_limits is not None and any([effective_limits.cpu_time, effective_limits.memory, effective_limits.heartbeats])
+        if cache:
+            key = cache.key(code, json_output, sorry_hammer, active_plugins,
+                            heartbeats=effective_limits.heartbeats if effective_limits is not None else None)
+            result = await cache.get(key)
+            if result is not None:
+                result['cache'] = 'hit'
+                return result
+        if pool is None:
+            pool = leanpool.default_pool
+        result = None
+        if pool and not limited:
+            single_pass = 'sorry' in code and any(getattr(p, 'single_pass', False) for p in active_plugins)
+            result = await pool.check(code, json_output=json_output, timeout=timeout, sorrys=single_pass, create=single_pass or create_worker)
+        if result is None:
+            result = await run_lean_file(code, json_output, timeout=timeout, limits=limits)
+        for p in active_plugins:
+            result=await p.process(code, result)
+        if cache:
+            # heartbeats are deterministic, unlike the other limits
+            if result.get('limit') in (None, 'heartbeats'):
+                await cache.put(key, {k: v for k, v in result.items() if k not in ['queue_depth', 'queue_wait', 'cache']})
+            result['cache'] = 'miss'
         return result
 
-    except subprocess.CalledProcessError as e:
+    except OSError as e:
         raise LeanToolException(f"Error running Lean: {str(e)}")
     except Exception as e:
         raise LeanToolException(f"Unexpected error: {str(e)}")
 
 
+async def check_lean_batch(codes: List[str], json_output: bool = False, sorry_hammer: bool = False, plugins = default_plugins, pool = None, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Check several snippets in parallel with `check_lean_code`, and return their results in order.
+    Snippets that share an import header with another snippet of the batch are checked on warm
+    workers for that header, as many as the snippets up to leanrunner's limit on concurrent Lean
+    processes, which are started if needed, so the imports are loaded once per worker.
+    Warm and cold checks alike count towards that limit.
+    A snippet that raises LeanToolException gets a failed result with the exception as its error.
+    """
+    imports = [leanpool.split_header(code)[0] for code in codes]
+    headers = [leanpool.header_key(i) for i in imports]
+    counts = {h: headers.count(h) for h in set(headers)}
+    if pool is None:
+        pool = leanpool.default_pool
+
+    async def check(code, header):
+        try:
+            return await check_lean_code(code, json_output, sorry_hammer, plugins=plugins, pool=pool,
+                                         timeout=timeout, create_worker=counts[header] > 1)
+        except LeanToolException as e:
+            return {"success": False, "output": "", "error": str(e)}
+
+    async with contextlib.AsyncExitStack() as stack:
+        if pool:
+            for h, i in {h: i for h, i in zip(headers, imports)}.items():
+                if counts[h] > 1:
+                    await stack.enter_async_context(pool.scaled(i, min(counts[h], leanrunner.default_runner.max_concurrency)))
+        return await asyncio.gather(*[check(code, h) for code, h in zip(codes, headers)])
+
+
+LIMIT_MESSAGES = {
+    'timeout': "Lean timed out after {timeout:g} seconds.",
+    'cpu_time': "Lean was stopped after using its CPU time limit.",
+    'oom': "Lean ran out of memory.",
+    'heartbeats': "Lean reached the maximum number of heartbeats: a tactic or computation is too expensive.",
+}
+
+async def run_lean_file(code: str, json_output: bool = False, timeout: Optional[float] = None, limits = None) -> Dict[str, Any]:
+    """Runs a new Lean process on the code and returns the results, before any plugins are applied."""
+    # Prepare command with optional JSON flag
+    args = ['--json'] if json_output else []
+    run = await leanrunner.run_lean(code, args, timeout=timeout, limits=limits)
+    
+    # Process the output
+    success = run['returncode'] == 0
+    output = run['stdout']
+    error = run['stderr'] if not success else None
+    limit = run['limit']
+    if limit:
+        # the configured timeout rather than the elapsed time, so that the message is the same on every run
+        error = LIMIT_MESSAGES[limit].format(timeout=timeout or leanrunner.default_runner.timeout or 0) + (f" {error}" if error else "")
+    
+    # Parse JSON output if requested and available
+    if json_output and output:
+        lines = [ln for ln in output.splitlines() if ln.strip()]
+        if limit and lines and not lines[-1].rstrip().endswith('}'):
+            # the last message was cut off when Lean was stopped
+            lines = lines[:-1]
+        try:
+            output = [json.loads(ln) for ln in lines]
+        except json.JSONDecodeError as err:
+            print(f"Failed to parse Lean JSON output: {err}.\n Keeping output as string.")
+    result = {
+        "success": success,
+        "output": output,
+        "error": error,
+        "queue_depth": run['queue_depth'],
+        "queue_wait": round(run['queue_wait'], 3)
+    }
+    if limit:
+        result['limit'] = limit
+    return result
+
+
 async def main(query):
     result = await interactive_lean_check(
         query,
@@ -1,12 +1,48 @@
 import re
-import subprocess
 import json
+import os
 import sys
-from typing import Dict, List, Any
+import contextlib
+import hashlib
+import random
+import shutil
+import threading
+from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass
 import asyncio
 import copy
 import traceback
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import leandiag
+import leanrunner
+from leancache import read_project_file
+
+
+# Marker printed before each test case (and after the last one, as case END),
+# with a timestamp in nanoseconds used to time the cases.
+CASE_MARKER = '#eval! do IO.println s!"@@LEANTOOL CASE {} {{← IO.monoNanosNow}}@@"'
+CASE_MARKER_RE = re.compile(r"^.*@@LEANTOOL CASE (\d+|END) (\d+)@@.*$\n?", re.MULTILINE)
+ERROR_LINE_RE = re.compile(r"^.*:\d+:\d+: error", re.MULTILINE)
+# Line printed by the compiled test harness with the `repr`s of the sampled inputs of a case
+INPUTS_RE = re.compile(r"^@@LEANTOOL INPUTS (.*)@@$\n?", re.MULTILINE)
+# Printed before the shrinks of the k-th input of a case, which `#shrinknl` logs as {"shrinks": [...]}
+SHRINKS_MARKER = '#eval! IO.println "@@LEANTOOL SHRINKS {}@@"'
+SHRINKS_MARKER_RE = re.compile(r"^.*@@LEANTOOL SHRINKS (\d+)@@.*$\n?", re.MULTILINE)
+SHRINKS_RE = re.compile(r'(\{"shrinks":.*\})\s*$', re.MULTILINE)
+
+# The compiled test harness is generated in the project's `.lake/pbtdp` (see the `pbtdp_harness` target
+# in lakefile.lean), and the executables are cached by a hash of the generated source.
+HARNESS_SRC_DIR = os.path.join('.lake', 'pbtdp')
+HARNESS_BUILD_PATH = os.path.join('.lake', 'build', 'bin', 'pbtdp_harness')
+HARNESS_CACHE_DIR = os.path.join(os.environ.get('LEANTOOL_CACHE_DIR') or os.path.expanduser('~/.cache/leantool'), 'pbtdp_harness')
+# Seconds for which a failed build of the harness is remembered, so that a transient failure is retried later
+HARNESS_FAILURE_TTL = 3600
 
 
 @dataclass
@@ -27,10 +63,54 @@ def extract_imports(code: str):
     return imports, rest
 
 
+# Number of Lean processes used at the same time by the MCP server and the command line
+DEFAULT_WORKERS = 4
+
+# Serializes harness builds within the process where fcntl is not available
+_harness_thread_lock = threading.Lock()
+
+
+@contextlib.asynccontextmanager
+async def harness_build_lock():
+    """
+    Builds of the test harness share one lake target, so only one can run at a time, across processes.
+    Without fcntl (on Windows), builds are only serialized within the process.
+    """
+    os.makedirs(HARNESS_SRC_DIR, exist_ok=True)
+    if fcntl is None:
+        while not _harness_thread_lock.acquire(blocking=False):
+            await asyncio.sleep(0.1)
+        try:
+            yield
+        finally:
+            _harness_thread_lock.release()
+        return
+    with open(os.path.join(HARNESS_SRC_DIR, 'build.lock'), 'w') as f:
+        await asyncio.to_thread(fcntl.flock, f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
 class PropertyBasedTester:
-    def __init__(self, spec: Dict[str, str]):
+    def __init__(self, spec: Dict[str, str], workers: int = 1, native: bool = False, build_timeout: Optional[float] = 1800,
+                 shrink_time: float = 30, max_shrink_candidates: int = 32, plausible_heartbeats: int = 200000):
+        """
+        `workers` is the number of Lean scripts run at the same time (also bounded by leanrunner).
+        With `native`, tests run in a compiled executable instead of `#eval!`, if the code can be compiled.
+        Failing inputs are shrunk for at most `shrink_time` seconds (0 disables shrinking),
+        evaluating at most `max_shrink_candidates` smaller inputs per round.
+        Each theorem checked by Plausible gets at most `plausible_heartbeats` heartbeats (see `maxHeartbeats`).
+        """
         self.function_signature = spec['function_signature']
         self.code_solution = spec['code_solution']
+        self.workers = max(1, workers)
+        self.native = native
+        self.build_timeout = build_timeout
+        self.shrink_time = shrink_time
+        self.max_shrink_candidates = max_shrink_candidates
+        self.plausible_heartbeats = plausible_heartbeats
     def extract_input_types(self) -> List[TestInput]:
         """Extract input parameter types from function signature."""
         # First split the signature into parameter groups
@@ -53,9 +133,10 @@ class PropertyBasedTester:
                                          
         return inputs
 
-    def generate_sample_script(self, type_name: str) -> str:
-        """Generate Lean script to sample given type."""
+    def generate_sample_script(self, type_names: List[str], count: int = 10, size: int = 9) -> str:
+        """Generate Lean script that prints `count` samples of each of the given types as JSON lines."""
         imports,rest=extract_imports(self.code_solution)
+        types = ', '.join(f'({t})' for t in type_names)
         return f"""
 import Plausible
 import LeanTool.Basic
@@ -66,9 +147,48 @@ set_option linter.unusedVariables false
 
 {rest}
 
-#samplenl {type_name}
+#samplenl json count {count} size {size} {types}
         """
 
+    def parse_samples(self, output: str, num_types: int) -> List[List[str]]:
+        """Parse the JSON lines printed by `#samplenl json` into one list of values per type."""
+        columns: List[List[str]] = [[] for _ in range(num_types)]
+        for ln in output.splitlines():
+            if not ln.startswith('{'):
+                continue
+            try:
+                values = json.loads(ln)['values']
+            except (ValueError, KeyError):
+                continue
+            for col, v in zip(columns, values):
+                col.append('('+v.replace('_','(by decide)')+')')
+        return columns
+
+    async def sample_inputs(self, input_types: List[TestInput], num_tests: int):
+        """
+        Fill in `values` of every input with `num_tests` samples, from a single Lean run.
+        If some type cannot be sampled, the types are sampled one at a time instead,
+        and the ones that fail get `(by decide)`.
+        """
+        if not input_types:
+            return
+        try:
+            output = await self.run_lean_script(self.generate_sample_script([inp.type_name for inp in input_types], num_tests))
+            columns = self.parse_samples(output, len(input_types))
+        except RuntimeError as e:
+            if not ('failed to synthesize' in str(e) or 'unknown identifier' in str(e)):
+                raise e
+            if len(input_types) == 1:
+                input_types[0].values = ['(by decide)'] * num_tests
+            else:
+                for inp in input_types:
+                    await self.sample_inputs([inp], num_tests)
+            return
+        for inp, col in zip(input_types, columns):
+            if len(col) < num_tests:
+                raise RuntimeError(f"Expected {num_tests} samples of {inp.type_name}, got {len(col)}:\n{output}")
+            inp.values = col[:num_tests]
+
     def generate_eval_script(self, inputs: List[str]) -> str:
         """Generate Lean script to evaluate function with given inputs."""
         input_params = " ".join(f"{inp}" for inp in inputs)
@@ -79,36 +199,274 @@ set_option linter.unusedVariables false
 
 {rest}
 
-#eval! {self.function_signature.split('(')[0].strip().replace('def', '')} {input_params}
+#eval! {self.function_name()} {input_params}
         """
 
-    def run_lean_script(self, script: str) -> str:
-        """Run Lean script and return output using a temporary file."""
-        import tempfile
-        import os
-        
-        # Create temporary file with .lean extension
-        with tempfile.NamedTemporaryFile(suffix='.lean', mode='w', encoding='utf-8', delete=False) as temp_file:
-            temp_file.write(script)
-            temp_path = temp_file.name
-            
-        try:
-            # Run Lean and capture output
-            result = subprocess.run(['lake','env','lean', temp_path], 
-                                  capture_output=True,
-                                  text=True)
-            
-            if result.returncode != 0:
-                raise RuntimeError(f"Lean script failed: {result.stdout}\n{result.stderr}\nscript:\n{script}")
-                
-            return result.stdout
-            
-        finally:
-            # Clean up temporary file
-            try:
-                os.unlink(temp_path)
-            except OSError:
-                pass  # Handle cleanup errors silently
+    def function_name(self) -> str:
+        return self.function_signature.split('(')[0].strip().replace('def', '').strip()
+
+    def generate_batch_eval_script(self, cases: List[List[str]], first: int = 0, shrink_types: Optional[List[str]] = None) -> str:
+        """
+        Generate one Lean script that evaluates the function on every test case.
+        Each case is a separate command, so an error in one case does not affect the others,
+        and is preceded by a marker line so that the output can be split per case.
+        Cases are numbered from `first`. With `shrink_types` (the types of the inputs),
+        the shrinks of each input are printed after the result, see `split_shrinks`.
+        """
+        imports,rest=extract_imports(self.code_solution)
+        evals = ''
+        for i, inputs in enumerate(cases):
+            evals += CASE_MARKER.format(first + i) + '\n'
+            evals += f'#eval! {self.function_name()} {" ".join(inputs)}\n'
+            for k, (type_name, value) in enumerate(zip(shrink_types or [], inputs)):
+                evals += SHRINKS_MARKER.format(k) + '\n'
+                evals += f'#shrinknl ({type_name}), {value}\n'
+        evals += CASE_MARKER.format('END') + '\n'
+        header = "import Plausible\nimport LeanTool.Basic\n" if shrink_types else ""
+        return f"""
+{header}{imports}
+set_option linter.unusedVariables false
+
+{rest}
+
+{evals}
+        """
+
+    def split_batch_output(self, output: str, num_cases: int) -> Tuple[List[Optional[str]], List[Optional[float]]]:
+        """
+        Split the output of a batch evaluation script into per-case outputs and times in seconds.
+        A case is None if it did not finish, or if the code before the first case had errors
+        (which would have made the whole single-case script fail).
+        """
+        parts = CASE_MARKER_RE.split(output)
+        cases: List[Optional[str]] = [None] * num_cases
+        times: List[Optional[float]] = [None] * num_cases
+        if ERROR_LINE_RE.search(parts[0]):
+            return cases, times
+        for i in range(1, len(parts) - 1, 3):
+            if parts[i] == 'END':
+                continue
+            case = int(parts[i])
+            cases[case] = parts[i+2]
+            if i + 3 < len(parts):
+                times[case] = (int(parts[i+4]) - int(parts[i+1])) / 1e9
+        return cases, times
+
+    async def run_batch(self, cases: List[List[str]], first: int = 0, shrink_types: Optional[List[str]] = None,
+                        timeout: Optional[float] = None) -> Tuple[List[Optional[str]], List[Optional[float]]]:
+        """
+        Evaluate the cases in one Lean run (see `generate_batch_eval_script`), and return the output and time
+        of each, as `split_batch_output` does. If Lean itself stops during a case (e.g. a stack overflow,
+        running out of memory, or the timeout), that case fails, and the cases after it are evaluated
+        in a new run, as they would have been in runs of their own.
+        """
+        t0 = time.monotonic()
+        run = await leanrunner.run_lean(self.generate_batch_eval_script(cases, first=first, shrink_types=shrink_types), timeout=timeout)
+        case_outputs, case_times = self.split_batch_output(run['stdout'], first + len(cases))
+        case_outputs, case_times = case_outputs[first:], case_times[first:]
+        started = [k for k, output in enumerate(case_outputs) if output is not None]
+        if not started or case_times[started[-1]] is not None:
+            return case_outputs, case_times
+        crashed = started[-1]
+        reason = run['limit'] or (run['stderr'].strip().splitlines() or [f"exit code {run['returncode']}"])[-1]
+        # before the case's output, which is followed by the shrinks when shrinking
+        case_outputs[crashed] = f"Error: Lean stopped while evaluating this case ({reason})\n" + case_outputs[crashed]
+        print(f"Lean stopped during test case {first + crashed} ({reason}); evaluating the remaining cases in a new run")
+        if crashed + 1 < len(cases):
+            if timeout is not None:
+                timeout -= time.monotonic() - t0
+            if timeout is None or timeout > 0:
+                rest = await self.run_batch(cases[crashed+1:], first + crashed + 1, shrink_types, timeout)
+                case_outputs[crashed+1:], case_times[crashed+1:] = rest
+        return case_outputs, case_times
+
+    def split_shrinks(self, output: str, num_inputs: int) -> Tuple[str, List[List[str]]]:
+        """Split the output of a case of a shrinking script into the function's output and the shrinks of each input."""
+        parts = SHRINKS_MARKER_RE.split(output)
+        shrinks: List[List[str]] = [[] for _ in range(num_inputs)]
+        for i in range(1, len(parts) - 1, 2):
+            m = SHRINKS_RE.search(parts[i+1])
+            if m:
+                shrinks[int(parts[i])] = ['('+v.replace('_','(by decide)')+')' for v in json.loads(m.group(1))['shrinks']]
+        return parts[0], shrinks
+
+    def classify(self, output: Optional[str]) -> Tuple[str, Optional[str]]:
+        """Classify the output of a test case as 'pass', 'fail' or 'unknown', and clean it up for reporting."""
+        if output is None or ERROR_LINE_RE.search(output):
+            return 'unknown', output
+        output = output.strip().splitlines()
+        output = ['' if 'warning' in ln else ln for ln in output]
+        output='\n'.join(output).strip()
+        return ('fail' if "Error:" in output or "failed check:" in output else 'pass'), output
+
+    async def shrink_round(self, input_types: List[TestInput], cases: List[List[str]], timeout: float) -> List[Tuple[str, Optional[str], List[List[str]]]]:
+        """
+        Evaluate the cases and compute the shrinks of their inputs, in one Lean run per worker.
+        Returns the classification, output and shrinks of each case.
+        """
+        types = [inp.type_name for inp in input_types]
+        chunks = self.chunks(len(cases))
+        batches = await self.gather_bounded([
+            self.run_batch(cases[c.start:c.stop], first=c.start, shrink_types=types, timeout=timeout) for c in chunks
+        ])
+        results = []
+        for c, (case_outputs, _) in zip(chunks, batches):
+            for j in range(len(c)):
+                if case_outputs[j] is None:
+                    results.append(('unknown', None, [[] for _ in types]))
+                    continue
+                out, shrinks = self.split_shrinks(case_outputs[j], len(types))
+                results.append(self.classify(out) + (shrinks,))
+        return results
+
+    async def shrink(self, input_types: List[TestInput], inputs: List[str], deadline: float) -> Optional[Tuple[List[str], str]]:
+        """
+        Greedily shrink a failing case: each round evaluates smaller candidates, obtained by replacing
+        one input with one of its shrinks (Plausible's `Shrinkable`), and continues from the first
+        candidate that still fails. Stops at a local minimum or at the deadline.
+        Returns the smallest failing inputs found and their output, or None if none was found.
+        """
+        best = None
+        candidates = [inputs]
+        while candidates and time.monotonic() < deadline:
+            results = await self.shrink_round(input_types, candidates, deadline - time.monotonic())
+            failing = [(c, out, shrinks) for c, (r, out, shrinks) in zip(candidates, results) if r == 'fail']
+            if not failing:
+                break
+            current, output, shrinks = failing[0]
+            if current is not inputs:
+                best = (current, output)
+            candidates = [current[:k] + [s] + current[k+1:] for k, ss in enumerate(shrinks) for s in ss]
+            candidates = candidates[:self.max_shrink_candidates]
+        return best
+
+    def chunks(self, num_cases: int) -> List[range]:
+        """Split the cases into one contiguous range per worker."""
+        if num_cases <= 0:
+            return []
+        chunk_size = -(-num_cases // min(self.workers, max(1, num_cases)))
+        return [range(i, min(i + chunk_size, num_cases)) for i in range(0, num_cases, chunk_size)]
+
+    def generate_harness(self, input_types: List[TestInput]) -> str:
+        """
+        Generate a Lean program that runs the function on sampled inputs.
+        It reads lines `case seed size` from stdin, samples each input with the seed and size,
+        and prints the same case markers as the batch evaluation script, then the inputs and the result.
+        """
+        imports,rest=extract_imports(self.code_solution)
+        samples = ''
+        for k, inp in enumerate(input_types):
+            samples += f'    let ({inp.name}, harnessRepr{k}) ← harnessSample ({inp.type_name}) harnessSize\n'
+        reprs = ', '.join(f'harnessRepr{k}' for k in range(len(input_types)))
+        args = ' '.join(inp.name for inp in input_types)
+        return f"""import Plausible
+import LeanTool.Basic
+{imports}
+set_option linter.unusedVariables false
+
+{rest}
+
+def main : IO Unit := do
+  let harnessStdin ← IO.getStdin
+  repeat
+    let [harnessCase, harnessSeed, harnessSize] := ((← harnessStdin.getLine).trim.splitOn " ").map String.toNat! | break
+    IO.println s!"@@LEANTOOL CASE {{harnessCase}} {{← IO.monoNanosNow}}@@"
+    IO.setRandSeed harnessSeed
+{samples}    IO.println s!"@@LEANTOOL INPUTS {{Lean.Json.compress (Lean.toJson [{reprs}])}}@@"
+    try
+      HarnessOutput.run ({self.function_name()} {args})
+    catch e =>
+      IO.println s!"<harness>:0:0: error: {{e}}"
+    (← IO.getStdout).flush
+  IO.println s!"@@LEANTOOL CASE END {{← IO.monoNanosNow}}@@"
+"""
+
+    async def build_harness(self, input_types: List[TestInput]) -> Optional[str]:
+        """
+        Compile the test harness with lake, or reuse the cached executable for the same source.
+        Returns the path of the executable, or None if the code cannot be compiled.
+        A failed build is remembered, with the compiler's output, for HARNESS_FAILURE_TTL seconds;
+        builds that were killed or timed out are not remembered.
+        """
+        source = self.generate_harness(input_types)
+        key = hashlib.sha256('\n'.join([
+            source, read_project_file('.', 'lean-toolchain'), read_project_file('.', 'lake-manifest.json')
+        ]).encode('utf-8')).hexdigest()
+        exe = os.path.join(HARNESS_CACHE_DIR, key)
+        if os.path.exists(exe + '.failed') and time.time() - os.path.getmtime(exe + '.failed') < HARNESS_FAILURE_TTL:
+            return None
+        if os.path.exists(exe):
+            return exe
+        os.makedirs(HARNESS_CACHE_DIR, exist_ok=True)
+        async with harness_build_lock():
+            if os.path.exists(exe):
+                return exe
+            with open(os.path.join(HARNESS_SRC_DIR, 'PbtdpHarness.lean'), 'w', encoding='utf-8') as f:
+                f.write(source)
+            print("Compiling test harness")
+            result = await leanrunner.default_runner.run(['lake', 'build', 'pbtdp_harness'], timeout=self.build_timeout)
+            if result['returncode'] != 0:
+                print(f"Failed to compile test harness, falling back to #eval!:\n{result['stdout']}\n{result['stderr']}")
+                if not result['timed_out'] and result['returncode'] > 0:
+                    with open(exe + '.failed', 'w', encoding='utf-8') as f:
+                        f.write(result['stdout'] + result['stderr'])
+                return None
+            shutil.copy2(HARNESS_BUILD_PATH, exe + '.tmp')
+            os.replace(exe + '.tmp', exe)
+        return exe
+
+    async def run_harness(self, exe: str, input_types: List[TestInput], num_tests: int) -> Tuple[List[Optional[str]], List[Optional[float]]]:
+        """
+        Run the test cases in the compiled harness, one process per worker.
+        Fills in the `values` of the inputs from the reprs printed by the harness.
+        """
+        lines = [f"{i} {random.randrange(2**32)} {i % 10}\n" for i in range(num_tests)]
+        chunks = self.chunks(num_tests)
+        runs = await self.gather_bounded([
+            leanrunner.default_runner.run([exe], input=''.join(lines[c.start:c.stop])) for c in chunks
+        ])
+        case_outputs: List[Optional[str]] = [None] * num_tests
+        case_times: List[Optional[float]] = [None] * num_tests
+        for inp in input_types:
+            inp.values = ['?'] * num_tests
+        for c, run in zip(chunks, runs):
+            chunk_outputs, chunk_times = self.split_batch_output(run['stdout'], num_tests)
+            for j in c:
+                output = chunk_outputs[j]
+                m = INPUTS_RE.search(output) if output is not None else None
+                if m:
+                    for inp, v in zip(input_types, json.loads(m.group(1))):
+                        inp.values[j] = '('+v.replace('_','(by decide)')+')'
+                    output = INPUTS_RE.sub('', output)
+                if not m or (chunk_times[j] is None and run['returncode'] != 0):
+                    # the harness crashed while sampling or running this case
+                    output = None
+                case_outputs[j], case_times[j] = output, chunk_times[j]
+        return case_outputs, case_times
+
+    async def gather_bounded(self, coros) -> List[Any]:
+        """Await the coroutines with at most `self.workers` running at a time; results are in input order."""
+        sem = asyncio.Semaphore(self.workers)
+        async def run(coro):
+            async with sem:
+                return await coro
+        return await asyncio.gather(*[run(c) for c in coros])
+
+    async def run_lean_script(self, script: str, timeout: Optional[float] = None, check: bool = True) -> str:
+        """
+        Run Lean script and return output. Goes through leanrunner's bounded, non-blocking process pool.
+        Unless `check` is False, raises RuntimeError if Lean reports an error or times out.
+        """
+        result = await leanrunner.run_lean(script, timeout=timeout)
+        if not check:
+            return result['stdout']
+        if result['timed_out']:
+            raise RuntimeError(f"Lean script timed out after {result['elapsed']:.0f} seconds: {result['stdout']}\n{result['stderr']}\nscript:\n{script}")
+        if result['limit']:
+            raise RuntimeError(f"Lean script stopped by the {result['limit']} limit: {result['stdout']}\n{result['stderr']}\nscript:\n{script}")
+        if result['returncode'] != 0:
+            raise RuntimeError(f"Lean script failed: {result['stdout']}\n{result['stderr']}\nscript:\n{script}")
+        return result['stdout']
 
     async def verify_property(self, inputs: List[str], output: str) -> str:
         """Call external verifier to check if property holds."""
@@ -141,26 +499,91 @@ import Plausible
   plausible
 """
         return script
-    def run_plausible_script(self, theorem_sig:str, do_simp=True):
+    def gen_plausible_batch_script(self, theorem_sigs: List[str], do_simp=True, preamble: str = '') -> Tuple[str, List[range]]:
+        """
+        Generate one script that runs plausible on each theorem, as in `gen_plausible_script`.
+        Each theorem is a separate command with its own heartbeat limit, so that a failure or
+        timeout in one theorem does not affect the others.
+        Also returns the range of line numbers of each theorem, to attribute Lean's messages.
+        """
+        code=self.code_solution.replace('def', '@[simp] def')
+        script=f"""
+import Plausible
+
+{code}
+{preamble}
+"""
+        ranges = []
+        simp_tac='simp' if do_simp else ''
+        for theorem_sig in theorem_sigs:
+            if not theorem_sig.strip().endswith(':='):
+                theorem_sig+=':='
+            start = script.count('\n') + 1
+            script += f"""
+set_option maxHeartbeats {self.plausible_heartbeats} in
+{theorem_sig} by
+  {simp_tac}
+  plausible
+"""
+            ranges.append(range(start, script.count('\n') + 1))
+        return script, ranges
+
+    def split_plausible_output(self, output: str, ranges: List[range]) -> List[str]:
+        """
+        Attribute the messages in Lean's output to the theorems by their line numbers.
+        Messages outside of every theorem (e.g. errors in the definitions) are given to all of them.
+        """
+        starts = list(leandiag.MESSAGE_START_RE.finditer(output))
+        common = output[:starts[0].start()] if starts else output
+        per_theorem = ['' for _ in ranges]
+        for m, next_m in zip(starts, starts[1:] + [None]):
+            msg = output[m.start():next_m.start() if next_m else len(output)]
+            line = int(m.group('line'))
+            owners = [i for i, r in enumerate(ranges) if line in r]
+            if owners:
+                per_theorem[owners[0]] += msg
+            else:
+                common += msg
+        return [common + out for out in per_theorem]
+
+    async def run_plausible_scripts(self, theorem_sigs: List[str], do_simp=True, preamble: str = '') -> List[Tuple[bool, str]]:
+        """
+        Run plausible on several theorems, in one Lean run per worker, with the same results as
+        calling `run_plausible_script` on each.
+        """
+        chunks = self.chunks(len(theorem_sigs))
+        scripts = [self.gen_plausible_batch_script(theorem_sigs[c.start:c.stop], do_simp, preamble) for c in chunks]
+        outputs = await self.gather_bounded([self.run_lean_script(script, check=False) for script, _ in scripts])
+        runs = []
+        for (script, ranges), output in zip(scripts, outputs):
+            for r in self.split_plausible_output(output, ranges):
+                runs.append((not 'error: Failed to create' in r, r))
+        return runs
+
+    async def run_plausible_script(self, theorem_sig:str, do_simp=True):
         success=True
         try:
-            r=self.run_lean_script(self.gen_plausible_script(theorem_sig,do_simp))
+            r=await self.run_lean_script(self.gen_plausible_script(theorem_sig,do_simp))
         except RuntimeError as e:
             r=str(e)
             if 'error: Failed to create' in r:
                 success=False
         return success,r
 
-    def try_plausible(self):
+    async def try_plausible(self):
         output=''
-        success,r=self.run_plausible_script(self.theorem_signature)
+        sigs = [self.theorem_signature]
+        if len(self.theorem2_signature.strip())>0:
+            sigs.append(self.theorem2_signature)
+        runs = await self.run_plausible_scripts(sigs)
+        success,r=runs[0]
         if success:
             output+=f"Result of running plausible on the theorem statement {self.theorem_signature}:\n"
             output+=r
         else:
             print (f'Plausible failed for {self.theorem_signature}:', r)
-        if len(self.theorem2_signature.strip())>0:
-            success,r=self.run_plausible_script(self.theorem2_signature)
+        if len(runs)>1:
+            success,r=runs[1]
             if success:
                 output+=f"\nResult of running plausible on the theorem statement {self.theorem2_signature}:\n"
                 output+=r
@@ -168,7 +591,7 @@ import Plausible
                 print(f'Plausible failed for {self.theorem2_signature}:',r)
         return output
 
-    def spec_plausible(self):
+    async def spec_plausible(self):
         output=''
         split = self.spec.split("\n\n")
         theorems = []
@@ -178,8 +601,8 @@ import Plausible
                 theorems.append(item.replace("sorry", ""))
             elif item.startswith("def") and 'sorry' not in item:
                 defs += '\n'+item
-        for th in theorems:
-            success,r=self.run_plausible_script(defs+'\n'+th, do_simp=False)
+        runs = await self.run_plausible_scripts(theorems, do_simp=False, preamble=defs)
+        for th, (success,r) in zip(theorems, runs):
             if success:
               if 'Unable to find a counter-example' in r:
                 print('plausible passed:\n'+r)
@@ -190,8 +613,21 @@ import Plausible
                 print (f'Plausible failed for {th}:', r)
         return output
 
+    async def evaluate_cases(self, input_types: List[TestInput], num_tests: int) -> Tuple[List[Optional[str]], List[Optional[float]]]:
+        """Evaluate the function on all sampled inputs with `#eval!`, in one Lean run per worker."""
+        cases = [[inp.values[test_num] for inp in input_types] for test_num in range(num_tests)]
+        chunks = self.chunks(num_tests)
+        batches = await self.gather_bounded([self.run_batch(cases[c.start:c.stop], first=c.start) for c in chunks])
+        case_outputs: List[Optional[str]] = []
+        case_times: List[Optional[float]] = []
+        for chunk_outputs, chunk_times in batches:
+            case_outputs += chunk_outputs
+            case_times += chunk_times
+        return case_outputs, case_times
+
     async def run_tests(self, num_tests: int = 20) -> Dict[str, Any]:
         """Run property-based tests."""
+        t0 = time.monotonic()
         results = {
             'total_tests': num_tests,
             'passed': 0,
@@ -202,31 +638,21 @@ import Plausible
 
         input_types = self.extract_input_types()
 
-        
-        for input_param in input_types:
-            sample_script = self.generate_sample_script(input_param.type_name)
-            while len(input_param.values)< num_tests:
-              try:
-                sample_output = self.run_lean_script(sample_script)
-                input_param.values += ['('+v.replace('_','(by decide)')+')' for v in sample_output.strip().split('\n\n') if 'warning' not in v]
-
-              except RuntimeError as e:
-                if 'failed to synthesize' in str(e) or 'unknown identifier' in str(e):
-                  input_param.values += ['(by decide)'] * num_tests
-                else: raise e
+        exe = await self.build_harness(input_types) if self.native else None
+        t_sampled = time.monotonic()
+        if exe is not None:
+            # The compiled harness samples the inputs itself
+            case_outputs, case_times = await self.run_harness(exe, input_types, num_tests)
+        else:
+            await self.sample_inputs(input_types, num_tests)
+            t_sampled = time.monotonic()
+            case_outputs, case_times = await self.evaluate_cases(input_types, num_tests)
+        results['native'] = exe is not None
+        failing = []
         for test_num in range(num_tests):
-            #inputs
-            inputs = [inp.values[test_num] for inp in input_types]
-            # Evaluate function
-            eval_script = self.generate_eval_script(inputs)
-            try:
-              output = self.run_lean_script(eval_script).strip().splitlines()
-              output = ['' if 'warning' in ln else ln for ln in output]
-              output='\n'.join(output).strip()
-              r = 'fail' if "Error:" in output or "failed check:" in output else 'pass'
-            except RuntimeError as e:
-              print (e)
-              r = 'unknown'
+            r, output = self.classify(case_outputs[test_num])
+            if r=='unknown':
+              print (f"Test case {test_num} did not finish: {output}")
             if r=='pass':
                 results['passed'] += 1
             elif r=='unknown':
@@ -235,14 +661,30 @@ import Plausible
                 results['failed'] += 1
                 results['failures'].append({
                     'inputs': {inp.name: inp.values[test_num] for inp in input_types},
-                    'output': output
+                    'output': output,
+                    'time': case_times[test_num]
                 })
-                
+                failing.append(test_num)
+        if failing and self.shrink_time > 0:
+            t_shrink = time.monotonic()
+            deadline = t_shrink + self.shrink_time
+            shrunk = await self.gather_bounded([
+                self.shrink(input_types, [inp.values[test_num] for inp in input_types], deadline) for test_num in failing
+            ])
+            for failure, s in zip(results['failures'], shrunk):
+                if s is not None:
+                    failure['shrunk_inputs'] = {inp.name: v for inp, v in zip(input_types, s[0])}
+                    failure['shrunk_output'] = s[1]
+            results['shrinking_time'] = time.monotonic() - t_shrink
+        results['case_times'] = case_times
+        results['sampling_time'] = t_sampled - t0
+        results['elapsed'] = time.monotonic() - t0
         return results
 
-async def run_property_testing(spec: Dict[str, str], num_tests: int = 20) -> Dict[str, Any]:
+async def run_property_testing(spec: Dict[str, str], num_tests: int = 20, workers: int = 1, native: bool = False,
+                               shrink_time: float = 30) -> Dict[str, Any]:
     """Main entry point for property-based testing."""
-    tester = PropertyBasedTester(spec)
+    tester = PropertyBasedTester(spec, workers=workers, native=native, shrink_time=shrink_time)
     return await tester.run_tests(num_tests=num_tests)
 
 
@@ -252,6 +694,9 @@ async def main():
     parser.add_argument('filename', help='Lean file to test')
     parser.add_argument('signature', nargs='+', help='Function signature to test')
     parser.add_argument('--num_test', type=int, default=5, help='Number of test cases to generate (default: 5)')
+    parser.add_argument('--shrink_time', type=float, default=30, help='Seconds spent shrinking failing inputs, 0 to disable (default: 30)')
+    parser.add_argument('--native', action='store_true', help='Compile the code into a native test harness instead of using #eval!')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'Number of Lean processes to run at the same time (default: {DEFAULT_WORKERS})')
     
     args = parser.parse_args()
     fn = args.filename
@@ -260,7 +705,7 @@ async def main():
     
     with open(fn, encoding='utf-8') as reader:
         jo={'function_signature':sig, 'code_solution':reader.read()}
-        res=await run_property_testing(jo, num_tests=num_tests)
+        res=await run_property_testing(jo, num_tests=num_tests, workers=args.workers, native=args.native, shrink_time=args.shrink_time)
         print (res)
 
 if __name__=='__main__':
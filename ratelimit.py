@@ -0,0 +1,139 @@
+import asyncio
+import json
+import random
+import time
+from typing import Dict, Any, Optional
+
+# HTTP status codes of errors that are worth retrying (529: Anthropic's "overloaded")
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+# litellm exception classes that are worth retrying, for errors without a status code
+RETRY_EXCEPTIONS = {'RateLimitError', 'APIConnectionError', 'Timeout', 'ServiceUnavailableError', 'InternalServerError'}
+
+
+class TokenBucket:
+    """
+    Allows `rate_per_minute` units per minute, in bursts of up to `capacity` (by default a minute's worth).
+    The balance can go negative when more is used than was acquired, which delays later acquisitions.
+    """
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        # waiters are served in order, so a large request is not starved by small ones
+        async with self._lock:
+            amount = min(amount, self.capacity)
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def debit(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+
+def provider_of(model: str) -> str:
+    """The provider prefix of a litellm model name, e.g. 'anthropic' for 'anthropic/claude-sonnet-4-20250514'."""
+    return model.split('/')[0] if '/' in model else 'openai'
+
+
+def retry_after(e: Exception) -> Optional[float]:
+    """Seconds to wait according to the retry-after header of an API error, if it has one."""
+    headers = getattr(e, 'litellm_response_headers', None) or getattr(getattr(e, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    for name in ['retry-after-ms', 'retry-after']:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(value) / (1000 if name == 'retry-after-ms' else 1)
+        except ValueError:
+            return None
+    return None
+
+
+def is_retryable(e: Exception) -> bool:
+    status = getattr(e, 'status_code', None)
+    if status is not None:
+        return status in RETRY_STATUS_CODES
+    return type(e).__name__ in RETRY_EXCEPTIONS
+
+
+class RateLimiter:
+    """
+    Per-provider limits on requests and tokens per minute, shared by all sessions that use the limiter,
+    and retries of failed requests with exponential backoff and jitter, honoring retry-after headers.
+    `limits` maps a provider (see `provider_of`) to a dict with `requests_per_minute` and/or `tokens_per_minute`;
+    providers without an entry are not limited.
+    """
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None, max_retries: int = 6,
+                 base_delay: float = 1, max_delay: float = 60):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.requests: Dict[str, TokenBucket] = {}
+        self.tokens: Dict[str, TokenBucket] = {}
+        for provider, limit in (limits or {}).items():
+            self.set_limits(provider, **limit)
+
+    def set_limits(self, provider: str, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests.pop(provider, None)
+        self.tokens.pop(provider, None)
+        if requests_per_minute:
+            self.requests[provider] = TokenBucket(requests_per_minute)
+        if tokens_per_minute:
+            self.tokens[provider] = TokenBucket(tokens_per_minute)
+
+    async def completion(self, acompletion, model: str, messages, **kwargs):
+        """
+        Call `acompletion(model=model, messages=messages, **kwargs)` within the provider's limits, with retries.
+        The token limit is charged an estimate of the prompt up front, then corrected with the response's `usage`;
+        for a streamed completion, `acompletion` should return the response assembled from the stream, with its usage.
+        """
+        provider = provider_of(model)
+        # rough estimate of the prompt size, corrected with the reported usage afterwards
+        estimate = len(json.dumps(messages, default=str)) // 4
+        for attempt in range(self.max_retries + 1):
+            if provider in self.requests:
+                await self.requests[provider].acquire()
+            if provider in self.tokens:
+                await self.tokens[provider].acquire(estimate)
+            try:
+                response = await acompletion(model=model, messages=messages, **kwargs)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                else:
+                    delay += random.uniform(0, self.base_delay)
+                print(f"LLM request failed ({type(e).__name__}), retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+            usage = getattr(response, 'usage', None)
+            if provider in self.tokens and usage is not None and getattr(usage, 'total_tokens', None):
+                self.tokens[provider].debit(usage.total_tokens - estimate)
+            return response
+
+
+# Limiter used by `leantool.interactive_lean_check`; no limits until configured
+default_limiter = RateLimiter()
+
+
+def configure(limits: Optional[Dict[str, Dict[str, float]]] = None, **kwargs):
+    """Replace the process-wide limiter, e.g. `configure({'anthropic': {'requests_per_minute': 50, 'tokens_per_minute': 80000}})`."""
+    global default_limiter
+    default_limiter = RateLimiter(limits, **kwargs)
@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import leandiag
+
+SORRY = "Main.lean:1:8: warning: declaration uses 'sorry'\n"
+ERROR = "Main.lean:9:2: error: unsolved goals\n"
+
+
+def goal_states(n):
+    return "\nGoal States from sorrys:\n" + "\n\n".join(f"x : Nat\n⊢ x + {i} = {i} + x" for i in range(n))
+
+
+def test_errors_come_before_a_large_preamble():
+    output = "x" * 60000 + "\n" + ERROR
+    compacted, stats = leandiag.compact_output(output)
+    assert ERROR in compacted
+    assert len(compacted) < 10000
+    assert stats['truncated'] == 1 and stats['omitted'] == 0
+
+
+def test_goal_states_are_their_own_item_and_cut_between_goals():
+    compacted, stats = leandiag.compact_output(SORRY + goal_states(200))
+    assert compacted.startswith(SORRY)
+    assert "Goal States from sorrys:" in compacted
+    assert "more goal states omitted" in compacted
+    goals = compacted.split("Goal States from sorrys:\n")[1].split("\n\n(")[0].split("\n\n")
+    assert all(g.startswith("x : Nat\n⊢ x + ") and g.endswith(" + x") for g in goals)
+    assert len(compacted) < 10000
+
+
+def test_errors_rank_before_goal_states():
+    policy = leandiag.DiagnosticsPolicy(max_message_chars=2000, max_total_chars=2500)
+    compacted, stats = leandiag.compact_output(SORRY + ERROR + goal_states(200), policy=policy)
+    assert ERROR in compacted
+
+
+def test_sorry_warning_is_never_dropped():
+    output = [{'severity': 'information', 'pos': {'line': i, 'column': 0}, 'data': f"info {i} " + "y" * 1000}
+              for i in range(2, 40)]
+    output = [{'severity': 'warning', 'pos': {'line': 1, 'column': 0}, 'data': "declaration uses 'sorry'"}] + output
+    output.append({'goals': goal_states(200)})
+    compacted, stats = leandiag.compact_output(output)
+    assert any(leandiag.SORRY_WARNING in m.get('data', '') for m in compacted)
+    assert stats['omitted'] > 0
+
+
+def test_repeated_messages_are_merged():
+    output = "".join(f"Main.lean:{ln}:2: error: simp made no progress\n" for ln in [3, 5, 7])
+    compacted, stats = leandiag.compact_output(output)
+    assert compacted.count("simp made no progress") == 1
+    assert "also reported at lines 5, 7" in compacted
+    assert stats['duplicates'] == 2
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import leanpool
+
+
+class FakeServer:
+    """Stands in for a Pantograph server: every check succeeds after a short delay."""
+    def __init__(self):
+        self.closed = False
+
+    async def check_compile_async(self, body):
+        await asyncio.sleep(0.01)
+        return []
+
+    async def gc_async(self):
+        pass
+
+    def _close(self):
+        self.closed = True
+
+
+async def fake_start(self):
+    self.server = FakeServer()
+    self.uses = 0
+    self.last_used = 0.0
+
+
+def test_eviction_does_not_strand_waiters(monkeypatch):
+    monkeypatch.setattr(leanpool.LeanWorker, 'start', fake_start)
+
+    async def run():
+        pool = leanpool.WarmPool(headers=[], max_import_sets=2, max_memory=None)
+        codes = [f"import H{h}\nexample : True := trivial -- {i}" for h in range(4) for i in range(2)]
+
+        async def check(code):
+            imports, body = leanpool.split_header(code)
+            async with pool.worker(imports, create=True) as worker:
+                return await worker.server.check_compile_async(body)
+
+        results = await asyncio.wait_for(asyncio.gather(*[check(code) for code in codes]), 10)
+        assert results == [[]] * len(codes)
+        # once idle, the pool is back within its limit
+        assert len(pool._idle) <= 2
+        assert not pool._users
+
+    asyncio.run(run())
+
+
+def test_pool_works_across_event_loops(monkeypatch):
+    monkeypatch.setattr(leanpool.LeanWorker, 'start', fake_start)
+    pool = leanpool.WarmPool(headers=[['H']], max_memory=None)
+
+    async def run():
+        codes = [f"import H\nexample : True := trivial -- {i}" for i in range(3)]
+        return await asyncio.wait_for(asyncio.gather(*[pool.check(code) for code in codes]), 10)
+
+    for _ in range(2):
+        assert all(r['success'] for r in asyncio.run(run()))
@@ -0,0 +1,23 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import leanrunner
+
+
+def test_runner_works_across_event_loops():
+    runner = leanrunner.LeanRunner(max_concurrency=1)
+
+    async def hold():
+        async with runner.slot():
+            await asyncio.sleep(0.01)
+
+    async def contend():
+        await asyncio.gather(*[hold() for _ in range(3)])
+
+    # e.g. app.py runs one event loop per chat message
+    for _ in range(2):
+        asyncio.run(contend())
+    assert runner.running == 0 and runner.waiting == 0
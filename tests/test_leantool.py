@@ -0,0 +1,120 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+litellm = pytest.importorskip('litellm')
+
+import leanrunner
+import leantool
+import ratelimit
+
+
+async def fake_run(self, cmd, timeout=None, input=None, limits=None):
+    """Stands in for a Lean process that reports an error in the file it was given, in text or JSON."""
+    path = cmd[-1]
+    if '--json' in cmd:
+        stdout = '{"severity": "error", "pos": {"line": 1, "column": 0}, "fileName": "%s", "data": "bad"}\n' % path
+    else:
+        stdout = f"{path}:1:0: error: bad\n"
+    return {"returncode": 1, "stdout": stdout, "stderr": "", "timed_out": False, "limit": None,
+            "queue_depth": 0, "queue_wait": 0.0, "elapsed": 0.1}
+
+
+@pytest.mark.parametrize('plain_text_mode', [True, False])
+def test_cold_runs_give_the_same_message(monkeypatch, plain_text_mode):
+    monkeypatch.setattr(leanrunner.LeanRunner, 'run', fake_run)
+
+    async def run():
+        return [await leantool.check_lean_code('example : False := by simp', json_output=not plain_text_mode,
+                                               pool=False, cache=False, plugins=[]) for _ in range(2)]
+
+    first, second = asyncio.run(run())
+    assert leanrunner.SOURCE_NAME in str(first['output'])
+    assert (leantool.format_result_content(first, plain_text_mode)
+            == leantool.format_result_content(second, plain_text_mode))
+
+
+def fake_checks(cf_result):
+    """check_lean_code for SorryHammer: the check_false run ends first with `cf_result`, the hammer run then succeeds."""
+    async def check(code, json_output=False, sorry_hammer=False, **kwargs):
+        if 'check_false' in code:
+            await asyncio.sleep(0.01)
+            return dict(cf_result)
+        await asyncio.sleep(0.1)
+        return {"success": True, "output": "", "error": None}
+    return check
+
+
+@pytest.mark.parametrize('cf_result', [
+    {"success": False, "output": "", "error": "Lean timed out after 10 seconds.", "limit": 'timeout'},
+    {"success": False, "output": "Main.lean:1:0: error: unknown package 'LeanTool'\n", "error": None},
+])
+def test_failed_check_false_is_not_a_disproof(monkeypatch, cf_result):
+    monkeypatch.setattr(leantool, 'check_lean_code', fake_checks(cf_result))
+    result = {"success": True, "output": "Main.lean:1:8: warning: declaration uses 'sorry'\n", "error": None}
+    result = asyncio.run(leantool.SorryHammer().process('example : 1 = 1 := by sorry', result))
+    assert 'successfully replaced' in result['output']
+    assert 'is false' not in result['output']
+    assert 'code' in result
+
+
+def test_disproof_stops_the_hammer(monkeypatch):
+    cf_result = {"success": False, "output": "Main.lean:1:0: error: Goal is false! Proof of negation:\nfun h => nomatch h\n", "error": None}
+    monkeypatch.setattr(leantool, 'check_lean_code', fake_checks(cf_result))
+    result = {"success": True, "output": "Main.lean:1:8: warning: declaration uses 'sorry'\n", "error": None}
+    result = asyncio.run(leantool.SorryHammer().process('example : 1 = 2 := by sorry', result))
+    assert 'is false' in result['output']
+    assert 'code' not in result
+
+
+def stream_chunk(text):
+    return litellm.ModelResponseStream(id='chunk', model='gpt-4o', choices=[
+        litellm.utils.StreamingChoices(index=0, delta=litellm.utils.Delta(content=text, role='assistant'))])
+
+
+def test_empty_stream_is_retried(monkeypatch):
+    calls = []
+
+    async def fake_acompletion(**kwargs):
+        calls.append(kwargs)
+
+        async def stream():
+            if len(calls) == 1:
+                return
+            for text in ["<Res", "ult>example : True := trivial</Result>", " more text"]:
+                yield stream_chunk(text)
+        return stream()
+
+    monkeypatch.setattr(leantool, 'acompletion', fake_acompletion)
+    monkeypatch.setattr(ratelimit, 'default_limiter', ratelimit.RateLimiter(base_delay=0.01))
+    result = asyncio.run(leantool.interactive_lean_check("Prove True.", model='openai/gpt-4o', plain_text_mode=True,
+                                                         llm_cache=False, max_attempts=0))
+    assert len(calls) == 2
+    assert result['success'] and result['final_code'] == 'example : True := trivial'
+
+
+def test_streamed_usage_is_charged_to_the_rate_limit(monkeypatch):
+    calls = []
+
+    async def fake_acompletion(**kwargs):
+        calls.append(kwargs)
+
+        async def stream():
+            yield stream_chunk("I don't know how to prove this.")
+            last = stream_chunk("")
+            last.usage = litellm.Usage(prompt_tokens=5000, completion_tokens=100, total_tokens=5100)
+            yield last
+        return stream()
+
+    limiter = ratelimit.RateLimiter({'openai': {'tokens_per_minute': 100000}})
+    monkeypatch.setattr(leantool, 'acompletion', fake_acompletion)
+    monkeypatch.setattr(ratelimit, 'default_limiter', limiter)
+    result = asyncio.run(leantool.interactive_lean_check("Prove True.", model='openai/gpt-4o', plain_text_mode=True,
+                                                         llm_cache=False, max_attempts=0))
+    assert calls[0]['stream_options'] == {'include_usage': True}
+    assert result['usage']['prompt_tokens'] == 5000
+    assert limiter.tokens['openai'].tokens < 100000 - 5000
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import leanrunner
+import pbtdp
+
+SPEC = {'function_signature': 'def f (x : Nat) : Bool', 'code_solution': 'def f (x : Nat) : Bool := x != 7'}
+CASE_RE = re.compile(r'#eval! do IO.println s!"@@LEANTOOL CASE (\S+) ')
+
+
+def fake_run_lean(runs):
+    """Stands in for Lean on a batch script: a case with input 0 crashes the whole process, as a stack overflow would."""
+    async def run_lean(script, args=[], timeout=None, limits=None):
+        runs.append(script)
+        stdout = ''
+        for t, line in enumerate(script.splitlines()):
+            m = CASE_RE.match(line)
+            if m:
+                stdout += f"@@LEANTOOL CASE {m.group(1)} {t}@@\n"
+            elif line.startswith('#eval! f 0'):
+                return {'stdout': stdout, 'stderr': 'Stack overflow detected. Aborting.\n', 'returncode': 134,
+                        'limit': None, 'timed_out': False}
+            elif line.startswith('#eval! f '):
+                stdout += 'false\n' if line.split()[-1] == '7' else 'true\n'
+        return {'stdout': stdout, 'stderr': '', 'returncode': 0, 'limit': None, 'timed_out': False}
+    return run_lean
+
+
+def test_cases_after_a_crash_are_still_evaluated(monkeypatch):
+    runs = []
+    monkeypatch.setattr(leanrunner, 'run_lean', fake_run_lean(runs))
+    tester = pbtdp.PropertyBasedTester(SPEC)
+    outputs, _ = asyncio.run(tester.run_batch([['1'], ['0'], ['2'], ['0'], ['3']]))
+    assert [tester.classify(o)[0] for o in outputs] == ['pass', 'fail', 'pass', 'fail', 'pass']
+    assert 'Stack overflow' in outputs[1]
+    assert len(runs) == 3
+
+
+def test_no_cases():
+    tester = pbtdp.PropertyBasedTester(SPEC, workers=4)
+    assert tester.chunks(0) == []
+    assert asyncio.run(tester.run_plausible_scripts([])) == []
+
+
+def test_failed_harness_builds_expire(monkeypatch, tmp_path):
+    builds = []
+
+    async def fake_run(cmd, timeout=None, input=None, limits=None):
+        builds.append(cmd)
+        return {'returncode': 1, 'stdout': 'error: unknown identifier', 'stderr': '', 'timed_out': False, 'limit': None}
+
+    monkeypatch.setattr(leanrunner.default_runner, 'run', fake_run)
+    monkeypatch.setattr(pbtdp, 'HARNESS_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(pbtdp, 'HARNESS_SRC_DIR', str(tmp_path / 'src'))
+    tester = pbtdp.PropertyBasedTester(SPEC, native=True)
+    input_types = tester.extract_input_types()
+    assert asyncio.run(tester.build_harness(input_types)) is None
+    assert asyncio.run(tester.build_harness(input_types)) is None
+    assert len(builds) == 1
+    for f in (tmp_path / 'cache').glob('*.failed'):
+        os.utime(f, (0, 0))
+    assert asyncio.run(tester.build_harness(input_types)) is None
+    assert len(builds) == 2